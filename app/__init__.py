@@ -1,5 +1,6 @@
 from flask import Flask
 from app.core.config import Config
+from app.core.aio import async_to_sync
 from app.core.extensions import supabase
 from app.routes.main import main_bp
 from app.routes.auth import auth_bp
@@ -9,6 +10,9 @@ from app.routes.chat import chat_bp
 def create_app():
     app = Flask(__name__, template_folder="templates")
 
+    # ✅ Async views run on the process-wide I/O loop (app/core/aio.py)
+    app.async_to_sync = async_to_sync
+
     # Load config
     app.config.from_object(Config)
 
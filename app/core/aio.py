@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ✅ One event loop per process, on its own thread, shared by every request.
+# Async Supabase / GenAI clients are created on it once and keep their
+# connection pools; request threads only hand coroutines over and wait, so
+# the I/O of all in-flight requests is multiplexed on this one loop.
+_loop = None
+_thread = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                _thread = threading.Thread(target=loop.run_forever, name="aio-loop", daemon=True)
+                _thread.start()
+                _loop = loop
+    return _loop
+
+
+def loop_started() -> bool:
+    return _loop is not None
+
+
+def run(coro, timeout: float | None = None):
+    """
+    Runs a coroutine on the shared loop and blocks the calling thread for the
+    result. The caller's contextvars (Flask request / session) are visible to it.
+    Must not be called from code already running on the loop.
+    """
+    loop = get_loop()
+    if threading.current_thread() is _thread:
+        coro.close()
+        raise RuntimeError("aio.run() called from the event loop thread; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+
+def iterate(agen):
+    """Sync generator over an async generator running on the shared loop (for streamed responses)."""
+    try:
+        while True:
+            try:
+                yield run(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run(agen.aclose())
+
+
+def async_to_sync(func):
+    """Flask hook (app.async_to_sync): async views run on the shared loop."""
+    def wrapper(*args, **kwargs):
+        return run(func(*args, **kwargs))
+    return wrapper
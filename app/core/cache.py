@@ -0,0 +1,87 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU with optional TTL (seconds).
+    Tracks hits / misses so callers can expose cache stats.
+    on_evict(key, value) is called (outside the lock) for entries pushed
+    out by size or expiry, e.g. to close pooled resources.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, on_evict=None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                expired = value
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+        self._evicted([(key, expired)])
+        return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+
+        evicted = []
+        with self._lock:
+            old = self._data.get(key)
+            if old is not None and old[0] is not value:
+                evicted.append((key, old[0]))
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+
+        self._evicted(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item is not None else default
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, value) for key, (value, _) in self._data.items()]
+            self._data.clear()
+        self._evicted(evicted)
+
+    def _evicted(self, items):
+        if self.on_evict is None:
+            return
+        for key, value in items:
+            self.on_evict(key, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,11 +1,26 @@
+import inspect
 from functools import wraps
 from flask import session, redirect, url_for, request
 
+
+def _login_redirect():
+    next_url = request.full_path.rstrip("?")
+    return redirect(url_for("auth.login", next=next_url))
+
+
 def login_required(view_func):
+    # ✅ Async views stay coroutine functions, so Flask still runs them as async
+    if inspect.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(*args, **kwargs):
+            if "user" not in session:
+                return _login_redirect()
+            return await view_func(*args, **kwargs)
+        return async_wrapper
+
     @wraps(view_func)
     def wrapper(*args, **kwargs):
         if "user" not in session:
-            next_url = request.full_path.rstrip("?")
-            return redirect(url_for("auth.login", next=next_url))
+            return _login_redirect()
         return view_func(*args, **kwargs)
     return wrapper
@@ -1,5 +1,6 @@
 import os
-from supabase import create_client
+import asyncio
+from supabase import create_client, acreate_client
 from authlib.integrations.flask_client import OAuth
 from app.core.config import Config
 
@@ -18,4 +19,23 @@ supabase = create_client(
     SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
 )
 
+# ✅ Async client for async views / services; created once on the shared I/O loop (app/core/aio.py)
+_async_supabase = None
+_async_supabase_lock = None
+
+
+async def get_async_supabase():
+    global _async_supabase, _async_supabase_lock
+    if _async_supabase is None:
+        if _async_supabase_lock is None:
+            _async_supabase_lock = asyncio.Lock()
+        async with _async_supabase_lock:
+            if _async_supabase is None:
+                _async_supabase = await acreate_client(
+                    Config.SUPABASE_URL,
+                    SUPABASE_SERVICE_KEY or SUPABASE_ANON_KEY
+                )
+    return _async_supabase
+
+
 oauth = OAuth()
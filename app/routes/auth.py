@@ -2,31 +2,13 @@ from flask import Blueprint, render_template, request, redirect, url_for, sessio
 from app.core.extensions import supabase, oauth
 from app.core.decorators import login_required
 from app.services.mailer import send_credentials_email
+from app.services.supabase_service import get_user, invalidate_user, is_profile_complete
 import logging
 
 auth_bp = Blueprint("auth", __name__)
 logger = logging.getLogger(__name__)
 
 
-# ✅ Helper: check profile complete
-def is_profile_complete(user_id: str) -> bool:
-    res = supabase.table("users") \
-        .select("username, first_name,last_name,phone_no") \
-        .eq("id", user_id) \
-        .single() \
-        .execute()
-
-    if not res.data:
-        return False
-
-    return bool(
-        res.data.get("username")
-        and res.data.get("first_name")
-        and res.data.get("last_name")
-        and res.data.get("phone_no")
-    )
-
-
 # -----------------------------
 # Register
 # -----------------------------
@@ -80,6 +62,7 @@ def register():
                 "last_name": last_name,
                 "phone_no": phone_no
             }).execute()
+            invalidate_user(user_data.id)
 
             try:
                 send_credentials_email(user_data.email, username, password)
@@ -169,6 +152,7 @@ def login():
                 "id": user_data.id,
                 "email": user_data.email
             }).execute()
+            invalidate_user(user_data.id)
 
             return redirect(next_url)
 
@@ -241,10 +225,11 @@ def google_callback():
                 "email": email,
                 # We don't have username yet if it's new
             }).execute()
+            invalidate_user(user_id)
 
         # Check existing username
-        db_user = supabase.table("users").select("username").eq("id", user_id).single().execute()
-        username = db_user.data.get("username") if db_user.data else None
+        db_user = get_user(user_id)
+        username = db_user.get("username") if db_user else None
 
         session.permanent = True
         session["user"] = {
@@ -298,6 +283,7 @@ def complete_profile():
             "last_name": last_name,
             "phone_no": phone_no
         }).eq("id", user_id).execute()
+        invalidate_user(user_id)
 
         # ✅ Update session username for navbar
         session["user"]["username"] = username
@@ -336,13 +322,7 @@ def profile():
     user_id = session["user"]["id"]
 
     # ✅ Fetch current user data
-    res = supabase.table("users") \
-        .select("username, first_name, last_name, phone_no, email, gemini_api_key") \
-        .eq("id", user_id) \
-        .single() \
-        .execute()
-
-    user_db = res.data if res.data else {}
+    user_db = get_user(user_id) or {}
 
     if request.method == "POST":
         new_username = request.form.get("username", "").strip().lower()
@@ -365,6 +345,7 @@ def profile():
         supabase.table("users").update({
             "username": new_username
         }).eq("id", user_id).execute()
+        invalidate_user(user_id)
 
         # ✅ Update session
         session["user"]["username"] = new_username
@@ -387,6 +368,7 @@ def update_api_key():
         update_data = {"gemini_api_key": gemini_api_key if gemini_api_key else None}
         
         supabase.table("users").update(update_data).eq("id", user_id).execute()
+        invalidate_user(user_id)
         
         # ✅ Update session if we store it there (we check DB each time for security usually, but consistent session is good)
         # For now, we rely on DB fetch in consumers, so no session update needed for key.
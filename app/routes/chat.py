@@ -1,112 +1,378 @@
-from flask import Blueprint, render_template, request, session
+from flask import Blueprint, Response, render_template, request, session, jsonify, stream_with_context
+from app.core import aio
 from app.core.decorators import login_required
-from app.core.extensions import supabase
+from app.core.extensions import get_async_supabase
+from app.services.supabase_service import aget_api_key, aget_pdf_list
 
-from app.services.chat.vector_store import search_in_vector_db
-from app.services.chat.rag_pipeline import generate_answer
+from app.services.chat.vector_store import asearch_in_vector_db, asearch_library
+from app.services.chat.hybrid_search import ahybrid_search, akeyword_only_search, is_keyword_query
+from app.services.chat.rag_pipeline import agenerate_answer, agenerate_answer_stream, format_context
 from app.services.chat.gemini_client import GeminiAPIError
+from app.services.chat.embedding_cache import aget_query_embedding, vector_literal
+from app.services.chat.context_builder import build_context
+from app.services.chat.answer_cache import afind_cached_answer
+from app.services.chat.summarizer import aget_stored_summary
+from app.services.chat.conversation_memory import (
+    ConversationMemory, aload_memory, arewrite_followup, looks_like_followup, remember_turn
+)
+from datetime import datetime
+import os
+import asyncio
+import json
+import uuid
+import base64
 import logging
 
 chat_bp = Blueprint("chat", __name__)
 logger = logging.getLogger(__name__)
 
-@chat_bp.route("/chat/<pdf_id>", methods=["GET", "POST"])
-@login_required
-def chat(pdf_id):
-    user_id = session["user"]["id"]
+# ✅ Messages rendered with the page / returned per "load older" request
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "20"))
+
+ERROR_ANSWER = "❌ Sorry, I encountered an error while processing your request. Please try again."
+
+
+def _is_summary_question(q_lower: str) -> bool:
+    return "summary" in q_lower or "summarize" in q_lower
+
+
+def _relevant(r: dict) -> bool:
+    # ✅ similarity threshold (tuneable); keyword-only hits have no similarity
+    return r["similarity"] is None or r["similarity"] > 0.20
+
+
+def _encode_cursor(row: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps([row["created_at"], row["id"]]).encode()).decode()
 
-    # ✅ Sidebar PDFs (show original name)
-    pdf_list = supabase.table("pdf_files") \
-        .select("id, filename, original_filename, created_at") \
-        .eq("user_id", user_id) \
-        .order("created_at", desc=True) \
-        .execute()
 
-    pdfs = pdf_list.data if pdf_list.data else []
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    """(created_at, id) of the oldest message already shown; ValueError if malformed."""
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(row_id))
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {cursor}") from e
 
-    # ✅ Load history
-    chat_rows = supabase.table("chat_history") \
+
+def _message(row: dict) -> dict:
+    return {"id": row["id"], "q": row["question"], "a": row["answer"], "created_at": row["created_at"]}
+
+
+async def _load_history(pdf_id: str, user_id: str, before: str | None = None, limit: int = CHAT_HISTORY_PAGE_SIZE):
+    """
+    One page of history, newest first in the DB (keyset on created_at, id) and
+    returned oldest first. Returns (messages, cursor); cursor loads the page
+    before it and is None once the start of the conversation is reached.
+    """
+    db = await get_async_supabase()
+    query = db.table("chat_history") \
         .select("id, question, answer, created_at") \
         .eq("pdf_id", pdf_id) \
-        .eq("user_id", user_id) \
-        .order("created_at", desc=False) \
+        .eq("user_id", user_id)
+
+    if before:
+        created_at, row_id = _decode_cursor(before)
+        # (created_at, id) < cursor; the plain lte bound is what the index range scan uses
+        query = query \
+            .lte("created_at", created_at) \
+            .or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+
+    chat_rows = await query \
+        .order("created_at", desc=True) \
+        .order("id", desc=True) \
+        .limit(limit + 1) \
         .execute()
 
-    messages = []
-    if chat_rows.data:
-        for row in chat_rows.data:
-            messages.append({"q": row["question"], "a": row["answer"]})
+    rows = chat_rows.data or []
+    cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [_message(row) for row in reversed(rows[:limit])], cursor
+
+
+async def _answer_from_library(user_id: str, question: str, library: list[dict], api_key=None, query_embedding=None):
+    """Library mode: search every PDF of the user, context labelled per document."""
+    names = {p["id"]: p.get("original_filename") or p["filename"] for p in library}
+    results = await asearch_library(user_id, list(names), question, top_k=8, api_key=api_key,
+                                    query_embedding=query_embedding)
+    filtered = [{**r, "document": names.get(r["pdf_id"])} for r in results if _relevant(r)]
+
+    if not filtered:
+        return "❌ Aapki kisi bhi PDF me iska answer available nahi hai.", None, None, None
+
+    # Not tied to this PDF, so the turn is kept out of its answer cache (no question_emb)
+    return None, question, format_context(build_context(filtered)), None
+
+
+async def _prepare_answer(pdf_id: str, user_id: str, question: str, api_key=None, library: list[dict] | None = None,
+                          memory: ConversationMemory | None = None, query_embedding=None):
+    """
+    Retrieval step of a chat turn. Returns (answer, prompt_question, context, question_emb):
+    answer is set when no generation is needed (cached / stored summary / no match),
+    otherwise prompt_question + context go to the LLM.
+    library (the user's PDF rows) switches to search across all of them.
+    memory (earlier turns) turns follow-ups into standalone questions for retrieval.
+    query_embedding is the question's embedding if it was already computed.
+    """
+    if memory:
+        rewritten = await arewrite_followup(question, memory, api_key=api_key)
+        if rewritten != question:
+            question, query_embedding = rewritten, None
+
+    if library is not None:
+        return await _answer_from_library(user_id, question, library, api_key, query_embedding)
+
+    q_lower = question.lower()
+
+    # ✅ Keyword-heavy questions (IDs, codes) are answered from the BM25 index, skipping the embedding call
+    results = None if _is_summary_question(q_lower) else await akeyword_only_search(pdf_id, question, top_k=8)
+    if results is not None:
+        return None, question, format_context(build_context(results)), None
+
+    # ✅ One embedding per turn: used for the answer cache and for retrieval
+    question_emb = query_embedding or await aget_query_embedding(question, api_key=api_key)
+
+    answer = await afind_cached_answer(pdf_id, user_id, question, question_emb)
+    if answer is not None:
+        return answer, None, None, question_emb
+
+    # ✅ Summary (precomputed at ingest over the whole document)
+    if _is_summary_question(q_lower):
+        summary = await aget_stored_summary(pdf_id, user_id, short="short" in q_lower)
+        if summary:
+            return summary, None, None, question_emb
+
+        # Fallback while the summary is still being built (or for older uploads)
+        context_results = await asearch_in_vector_db(pdf_id, "overall document summary", top_k=10, api_key=api_key)
+
+        if not context_results:
+            return "❌ Summary generate nahi ho paya, because PDF indexing incomplete hai. Please re-upload PDF.", None, None, question_emb
+
+        if "short" in q_lower:
+            summary_prompt = "Give a short summary of this PDF in 6-8 bullet points."
+        else:
+            summary_prompt = "Give a clean structured summary of this PDF in bullet points."
+
+        return None, summary_prompt, format_context(build_context(context_results)), question_emb
+
+    # ✅ Normal question: vector + keyword (BM25) results, fused
+    results = await ahybrid_search(pdf_id, question, top_k=8, api_key=api_key, query_embedding=question_emb)
+    filtered = [r for r in results if _relevant(r)]
+
+    if not filtered:
+        return "❌ Is PDF me iska answer available nahi hai.", None, None, question_emb
+
+    return None, question, format_context(build_context(filtered)), question_emb
+
+
+async def _key_and_embedding(user_id: str, question: str):
+    """
+    API key, then the question's embedding when retrieval will need it as is
+    (not a follow-up, summary or keyword query), so the embedding call
+    overlaps the other lookups of the turn. A failed call is left to retrieval.
+    """
+    api_key = await aget_api_key(user_id)
+    if looks_like_followup(question) or _is_summary_question(question.lower()) or is_keyword_query(question):
+        return api_key, None
+
+    try:
+        return api_key, await aget_query_embedding(question, api_key=api_key)
+    except Exception as e:
+        logger.warning(f"Early query embedding failed: {e}")
+        return api_key, None
+
+
+async def _settled(coro):
+    """Result of coro, or the exception it raised (re-raised where the turn handles errors)."""
+    try:
+        return await coro
+    except Exception as e:
+        return e
+
+
+def _unwrap(result):
+    if isinstance(result, Exception):
+        raise result
+    return result
 
-    if request.method == "POST":
-        question = (request.form.get("question") or "").strip()
 
+async def _save_turn(pdf_id: str, user_id: str, question: str, answer: str, question_emb) -> dict:
+    db = await get_async_supabase()
+    res = await db.table("chat_history").insert({
+        "pdf_id": pdf_id,
+        "user_id": user_id,
+        "question": question,
+        "answer": answer,
+        "question_embedding": vector_literal(question_emb) if question_emb is not None else None
+    }).execute()
+
+    row = res.data[0] if res.data else {}
+    return {"id": row.get("id"), "q": question, "a": answer, "created_at": row.get("created_at")}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@chat_bp.route("/chat/<pdf_id>", methods=["GET", "POST"])
+@login_required
+async def chat(pdf_id):
+    user_id = session["user"]["id"]
+
+    # ✅ Ingestion job still running? (set by upload redirect)
+    job_id = request.args.get("job")
+
+    # ✅ JSON clients (the chat page's fallback) only get the new turn back
+    wants_json = request.method == "POST" and request.accept_mimetypes.best == "application/json"
+    question = (request.form.get("question") or "").strip() if request.method == "POST" else ""
+
+    # ✅ Sidebar PDFs (show original name), latest history page, API key +
+    # query embedding and conversation memory are independent: awaited together
+    # (sidebar + key usually come from the per-user cache).
+    # A failed key / memory lookup becomes the turn's error answer, not a 500.
+    lookups = [aget_pdf_list(user_id)]
+    if not wants_json:
+        lookups.append(_load_history(pdf_id, user_id))
+    if question:
+        lookups.append(_settled(_key_and_embedding(user_id, question)))
+        lookups.append(_settled(aload_memory(pdf_id, user_id)))
+
+    results = list(await asyncio.gather(*lookups))
+    pdfs = results.pop(0)
+    messages, history_cursor = results.pop(0) if not wants_json else ([], None)
+
+    if request.method == "POST":
         if not question:
+            if wants_json:
+                return jsonify({"error": "Please type a question."}), 400
             return render_template(
                 "chat.html",
                 user=session.get("user"),
                 pdf_id=pdf_id,
                 messages=messages,
+                history_cursor=history_cursor,
                 pdfs=pdfs,
+                job_id=job_id,
                 error="Please type a question."
             )
 
-        q_lower = question.lower()
+        key_lookup, memory_lookup = results
+        user_api_key = question_emb = memory = None
 
         try:
-            # ✅ Fetch User's API Key
-            user_data = supabase.table("users").select("gemini_api_key").eq("id", user_id).single().execute()
-            user_api_key = user_data.data.get("gemini_api_key") if user_data.data else None
-
-            # ✅ Summary
-            if "summary" in q_lower or "summarize" in q_lower:
-                context_results = search_in_vector_db(pdf_id, "overall document summary", top_k=10, api_key=user_api_key)
-
-                if not context_results:
-                    answer = "❌ Summary generate nahi ho paya, because PDF indexing incomplete hai. Please re-upload PDF."
-                else:
-                    context = "\n\n".join([r["text"] for r in context_results])
-
-                    if "short" in q_lower:
-                        summary_prompt = "Give a short summary of this PDF in 6-8 bullet points."
-                    else:
-                        summary_prompt = "Give a clean structured summary of this PDF in bullet points."
-
-                    answer = generate_answer(summary_prompt, context, api_key=user_api_key)
+            (user_api_key, question_emb), memory = _unwrap(key_lookup), _unwrap(memory_lookup)
+            library = pdfs if request.form.get("scope") == "library" else None
+            answer, prompt_question, context, question_emb = await _prepare_answer(
+                pdf_id, user_id, question, user_api_key, library, memory, question_emb
+            )
+            if answer is None:
+                answer = await agenerate_answer(prompt_question, context, api_key=user_api_key,
+                                                history=memory.render() or None)
 
-            else:
-                # ✅ Normal question
-                results = search_in_vector_db(pdf_id, question, top_k=8, api_key=user_api_key)
-
-                if not results:
-                    answer = "❌ Is PDF me iska answer available nahi hai."
-                else:
-                    # ✅ similarity threshold (tuneable)
-                    filtered = [r for r in results if r["similarity"] > 0.20]
-
-                    if not filtered:
-                        answer = "❌ Is PDF me iska answer available nahi hai."
-                    else:
-                        context = "\n\n".join([r["text"] for r in filtered])
-                        answer = generate_answer(question, context, api_key=user_api_key)
-                        
         except Exception as e:
             logger.error(f"Chat RAG/Generation failed: {e}", exc_info=True)
-            answer = "❌ Sorry, I encountered an error while processing your request. Please try again."
+            answer = ERROR_ANSWER
 
         # ✅ Save chat history
-        supabase.table("chat_history").insert({
-            "pdf_id": pdf_id,
-            "user_id": user_id,
-            "question": question,
-            "answer": answer
-        }).execute()
+        turn = await _save_turn(pdf_id, user_id, question, answer, question_emb)
+        remember_turn(pdf_id, user_id, memory, turn, api_key=user_api_key)
+        if wants_json:
+            return jsonify(turn)
 
-        messages.append({"q": question, "a": answer})
+        messages.append(turn)
 
     return render_template(
         "chat.html",
         user=session.get("user"),
         pdf_id=pdf_id,
         messages=messages,
-        pdfs=pdfs
+        history_cursor=history_cursor,
+        pdfs=pdfs,
+        job_id=job_id
+    )
+
+
+@chat_bp.route("/chat/<pdf_id>/history")
+@login_required
+async def chat_history(pdf_id):
+    """Older messages for lazy loading: ?before=<cursor> from the previous page."""
+    try:
+        messages, cursor = await _load_history(pdf_id, session["user"]["id"], before=request.args.get("before"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"messages": messages, "next_cursor": cursor})
+
+
+@chat_bp.route("/chat/<pdf_id>/stream", methods=["POST"])
+@login_required
+def chat_stream(pdf_id):
+    """
+    Same turn as POST /chat/<pdf_id>, streamed as Server-Sent Events:
+    "token" events carry answer text as it is generated, then one "done"
+    event with the full answer. History is saved once the stream completes.
+    The generator runs on the request thread; each step it waits on
+    (lookups, retrieval, the next token) runs on the shared event loop.
+    """
+    user_id = session["user"]["id"]
+    question = (request.form.get("question") or "").strip()
+
+    if not question:
+        return jsonify({"error": "Please type a question."}), 400
+
+    library_scope = request.form.get("scope") == "library"
+
+    async def prepare():
+        lookups = [_key_and_embedding(user_id, question), aload_memory(pdf_id, user_id)]
+        if library_scope:
+            lookups.append(aget_pdf_list(user_id))
+        (api_key, question_emb), memory, *library = await asyncio.gather(*lookups)
+
+        prepared = await _prepare_answer(
+            pdf_id, user_id, question, api_key, library[0] if library else None, memory, question_emb
+        )
+        return api_key, memory, prepared
+
+    def events():
+        question_emb = None
+        memory = user_api_key = None
+        pieces = []
+
+        try:
+            user_api_key, memory, prepared = aio.run(prepare())
+            answer, prompt_question, context, question_emb = prepared
+
+            if answer is not None:
+                # Cached / precomputed answers go out in one piece
+                pieces.append(answer)
+                yield _sse("token", {"text": answer})
+            else:
+                history = memory.render() or None
+                stream = agenerate_answer_stream(prompt_question, context, api_key=user_api_key, history=history)
+                for piece in aio.iterate(stream):
+                    pieces.append(piece)
+                    yield _sse("token", {"text": piece})
+
+            answer = "".join(pieces).strip()
+
+        except GeneratorExit:
+            # Client went away mid-answer: keep whatever was generated
+            answer = "".join(pieces).strip()
+            if answer:
+                aio.run(_save_turn(pdf_id, user_id, question, answer, question_emb))
+            raise
+
+        except Exception as e:
+            logger.error(f"Chat stream failed: {e}", exc_info=True)
+            answer = str(e) if isinstance(e, GeminiAPIError) and not pieces else ERROR_ANSWER
+            yield _sse("error", {"message": answer})
+
+        # ✅ Save chat history once the full answer exists
+        turn = aio.run(_save_turn(pdf_id, user_id, question, answer, question_emb))
+        remember_turn(pdf_id, user_id, memory, turn, api_key=user_api_key)
+        yield _sse("done", {"answer": answer})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
@@ -1,23 +1,40 @@
+import hmac
 import uuid
-from flask import Blueprint, render_template, request, redirect, url_for, session
+import asyncio
+import hashlib
+from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
 from werkzeug.utils import secure_filename
 
 from app.core.decorators import login_required
-from app.core.extensions import supabase
-
-from app.services.chat.pdf_utils import extract_text_from_pdf_bytes
-from app.services.chat.chunking import chunk_text
-from app.services.chat.vector_store import add_to_vector_db
+from app.core.extensions import get_async_supabase
+
+from app.services.supabase_service import aget_api_key, invalidate_user, invalidate_pdf_list
+from app.services.jobs import (
+    create_job, aget_job, job_eta_seconds, needs_worker, kick_worker, INGEST_QUEUE_BACKEND, INGEST_WORKER_SECRET
+)
+from app.services.chat.ingestion import enqueue_ingestion, run_queued_ingestions
+from app.services.chat.vector_store import get_vector_store
 import logging
 
 pdf_bp = Blueprint("pdf", __name__)
 logger = logging.getLogger(__name__)
 
+
+def _read_upload():
+    """Parses the multipart body and returns (file, bytes, sha256); blocking, so callers run it in a thread."""
+    pdf_file = request.files.get("pdf")
+    if not pdf_file:
+        return None, b"", None
+    file_bytes = pdf_file.read()
+    return pdf_file, file_bytes, hashlib.sha256(file_bytes).hexdigest()
+
+
 @pdf_bp.route("/upload", methods=["GET", "POST"])
 @login_required
-def upload_pdf():
+async def upload_pdf():
     if request.method == "POST":
-        pdf_file = request.files.get("pdf")
+        # ✅ Read bytes ONCE (works in Vercel); parsing + hashing stay off the event loop
+        pdf_file, file_bytes, file_hash = await asyncio.to_thread(_read_upload)
 
         if not pdf_file:
             return render_template("upload.html", user=session.get("user"), error="Please upload a PDF file.")
@@ -28,13 +45,15 @@ def upload_pdf():
 
         unique_name = f"{uuid.uuid4()}_{original_name}"
         user_id = session["user"]["id"]
+        db = await get_async_supabase()
 
         # ✅ Check & Update API Key from Form
         gemini_api_key = request.form.get("gemini_api_key")
         if gemini_api_key:
             # Update user's key in DB
             try:
-                supabase.table("users").update({"gemini_api_key": gemini_api_key}).eq("id", user_id).execute()
+                await db.table("users").update({"gemini_api_key": gemini_api_key}).eq("id", user_id).execute()
+                invalidate_user(user_id)
                 # Update session
                 session["user"]["gemini_api_key"] = gemini_api_key
                 session.modified = True
@@ -43,14 +62,31 @@ def upload_pdf():
         elif not session["user"].get("gemini_api_key"):
              return render_template("upload.html", user=session.get("user"), error="Gemini API Key is required.")
 
-        # ✅ Read bytes ONCE (works in Vercel)
-        file_bytes = pdf_file.read()
-
         # ✅ Upload to Supabase Storage
         storage_path = f"{user_id}/{unique_name}"
 
+        # ✅ Fast path: the user already uploaded these exact bytes -> clone chunks, skip extraction + embedding
+        # (only the Supabase vector backend keeps its chunks where the RPC can copy them)
+        reused = None
+        if get_vector_store().supports_clone:
+            try:
+                reused = await db.rpc("clone_indexed_pdf", {
+                    "p_user_id": user_id,
+                    "p_file_hash": file_hash,
+                    "p_filename": unique_name,
+                    "p_original_filename": original_name
+                }).execute()
+            except Exception as e:
+                logger.error(f"Duplicate lookup failed for {original_name}: {e}", exc_info=True)
+
+        if reused and reused.data:
+            pdf_id = reused.data[0]["pdf_id"]
+            invalidate_pdf_list(user_id)
+            logger.info(f"Reused existing index for {original_name} ({file_hash[:12]})")
+            return redirect(url_for("chat.chat", pdf_id=pdf_id))
+
         try:
-            supabase.storage.from_("pdfs").upload(
+            await db.storage.from_("pdfs").upload(
                 path=storage_path,
                 file=file_bytes,
                 file_options={"content-type": "application/pdf"}
@@ -64,37 +100,81 @@ def upload_pdf():
             )
 
         # ✅ Save metadata in DB
-        pdf_row = supabase.table("pdf_files").insert({
+        pdf_row = await db.table("pdf_files").insert({
             "user_id": user_id,
             "filename": unique_name,
             "original_filename": original_name,
-            "storage_path": storage_path
+            "storage_path": storage_path,
+            "file_hash": file_hash
         }).execute()
 
         if not pdf_row.data:
             return render_template("upload.html", user=session.get("user"), error="PDF saved but DB insert failed.")
 
+        invalidate_pdf_list(user_id)
+
         pdf_id = pdf_row.data[0]["id"]
 
-        # ✅ Extract text directly from bytes (NO LOCAL TEMP FILE)
+        # ✅ Extract / chunk / embed in a background job (no request timeouts on big PDFs)
         try:
-            # ✅ Fetch User's API Key
-            user_data = supabase.table("users").select("gemini_api_key").eq("id", user_id).single().execute()
-            user_api_key = user_data.data.get("gemini_api_key") if user_data.data else None
+            # ✅ User's API Key (just written above, or from the per-user cache)
+            user_api_key = gemini_api_key or await aget_api_key(user_id)
 
-            text = extract_text_from_pdf_bytes(file_bytes)
-
-            # ✅ Adaptive chunking (your latest logic)
-            chunks = chunk_text(text)
+            # Sync job store / queue (the inline backend may run the whole ingestion): kept off the event loop
+            job = await asyncio.to_thread(create_job, pdf_id, user_id)
+            await asyncio.to_thread(
+                enqueue_ingestion, job["id"], pdf_id, user_id, storage_path, file_bytes=file_bytes, api_key=user_api_key
+            )
 
-            # ✅ Store chunks into Supabase pgvector table (with user key)
-            add_to_vector_db(pdf_id, user_id, chunks, api_key=user_api_key)
-            
         except Exception as e:
-            logger.error(f"PDF Processing/Vector Store failed for {original_name}: {e}", exc_info=True)
-            # Optional: Delete the file from DB/Storage to clean up?
+            logger.error(f"Failed to start ingestion for {original_name}: {e}", exc_info=True)
             return render_template("upload.html", user=session.get("user"), error=f"Processing failed: {str(e)}")
 
-        return redirect(url_for("chat.chat", pdf_id=pdf_id))
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({
+                "job_id": job["id"],
+                "pdf_id": pdf_id,
+                "status_url": url_for("pdf.job_status", job_id=job["id"])
+            }), 202
+
+        return redirect(url_for("chat.chat", pdf_id=pdf_id, job=job["id"]))
 
     return render_template("upload.html", user=session.get("user"))
+
+
+@pdf_bp.route("/upload/jobs/<job_id>")
+@login_required
+async def job_status(job_id):
+    job = await aget_job(job_id, session["user"]["id"])
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    # ✅ Queued too long / worker gone: the page's polling wakes a new worker
+    if needs_worker(job):
+        await asyncio.to_thread(kick_worker)
+
+    return jsonify({
+        "job_id": job["id"],
+        "pdf_id": job["pdf_id"],
+        "status": job["status"],
+        "pages_done": job.get("pages_done") or 0,
+        "pages_total": job.get("pages_total") or 0,
+        "chunks_embedded": job.get("chunks_embedded") or 0,
+        "chunks_total": job.get("chunks_total") or 0,
+        "eta_seconds": job_eta_seconds(job),
+        "error": job.get("error")
+    })
+
+
+@pdf_bp.route("/upload/jobs/run", methods=["GET", "POST"])
+def run_jobs():
+    """Worker entry point of the "supabase" ingestion queue (upload kick, cron, stalled-job poll)."""
+    # ✅ Only the "supabase" queue has a worker endpoint, and only callers holding the secret may run it
+    if INGEST_QUEUE_BACKEND != "supabase":
+        return jsonify({"error": "Not found"}), 404
+
+    auth = request.headers.get("Authorization", "")
+    if not INGEST_WORKER_SECRET or not hmac.compare_digest(auth, f"Bearer {INGEST_WORKER_SECRET}"):
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify({"jobs_run": run_queued_ingestions()})
@@ -0,0 +1,55 @@
+import os
+import logging
+
+from app.core.extensions import get_async_supabase
+from app.services.chat.embedding_cache import vector_literal
+from app.services.chat.keyword_index import exact_terms
+
+logger = logging.getLogger(__name__)
+
+# ✅ Reuse a stored answer when a new question is this similar (cosine) to a past one
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+async def afind_cached_answer(pdf_id: str, user_id: str, question: str, query_embedding) -> str | None:
+    """
+    Looks up chat_history for a near-identical question on the same PDF
+    (RPC: match_cached_answer). Only answers given after the PDF's last
+    (re)indexing count, so changed chunks invalidate the cache. Numbers and
+    identifiers must match too: "page 3" and "page 4" embed almost alike.
+    """
+    if not ANSWER_CACHE_ENABLED or query_embedding is None:
+        return None
+
+    try:
+        db = await get_async_supabase()
+        res = await db.rpc("match_cached_answer", _params(pdf_id, user_id, query_embedding)).execute()
+    except Exception as e:
+        # ✅ A cache lookup failure just means a normal (uncached) answer
+        logger.warning(f"Answer cache lookup failed for pdf {pdf_id}: {e}")
+        return None
+
+    return _answer(pdf_id, question, res.data)
+
+
+def _params(pdf_id: str, user_id: str, query_embedding) -> dict:
+    return {
+        "match_pdf_id": pdf_id,
+        "match_user_id": user_id,
+        "query_embedding": vector_literal(query_embedding),
+        "min_similarity": ANSWER_CACHE_THRESHOLD
+    }
+
+
+def _answer(pdf_id: str, question: str, rows) -> str | None:
+    if not rows:
+        return None
+
+    row = rows[0]
+    if exact_terms(row["question"]) != exact_terms(question):
+        logger.info(f"Answer cache skipped for pdf {pdf_id}: numbers / identifiers differ")
+        return None
+
+    logger.info(f"Answer cache hit for pdf {pdf_id} (similarity {row['similarity']:.3f})")
+    return row["answer"]
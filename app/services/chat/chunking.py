@@ -1,47 +1,66 @@
+import os
+import re
+import math
+from collections import Counter
+
+# ✅ "structured" (sentence/paragraph aware), "semantic" (structured + topic breaks)
+# or "fixed" (legacy fixed-width slicing with overlap)
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "structured")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+
+
+def _auto_chunk_size(total_len: int) -> int:
+    # ✅ Auto chunk size by PDF text length
+    if total_len < 15_000:
+        return 1000
+    elif total_len < 80_000:
+        return 1200
+    elif total_len < 200_000:
+        return 1500
+    return 1800
+
+
+def _resolve_sizes(total_len: int, chunk_size, overlap, min_chunk: int, max_chunk: int):
+    if chunk_size is None:
+        chunk_size = _auto_chunk_size(total_len)
+
+    chunk_size = max(min_chunk, min(max_chunk, chunk_size))
+
+    # ✅ Auto overlap
+    if overlap is None:
+        overlap = int(chunk_size * 0.15)
+
+    overlap = max(120, min(overlap, int(chunk_size * 0.30)))
+    return chunk_size, overlap
+
+
 def chunk_text(
     text: str,
     chunk_size: int | None = None,
     overlap: int | None = None,
     min_chunk: int = 900,
     max_chunk: int = 1800,
-    max_chunks: int = 250
+    max_chunks: int | None = None
 ):
     """
     Adaptive chunking for unknown PDF sizes.
 
     - If chunk_size not given, auto choose based on text length
     - overlap defaults to 15% of chunk_size
-    - prevents too many chunks (max_chunks)
+    - max_chunks optionally caps the chunk count (no cap by default;
+      large documents are covered by hierarchical section search)
     """
 
     if not text:
         return []
 
     total_len = len(text)
-
-    # ✅ Auto chunk size by PDF text length
-    if chunk_size is None:
-        if total_len < 15_000:
-            chunk_size = 1000
-        elif total_len < 80_000:
-            chunk_size = 1200
-        elif total_len < 200_000:
-            chunk_size = 1500
-        else:
-            chunk_size = 1800
-
-    chunk_size = max(min_chunk, min(max_chunk, chunk_size))
-
-    # ✅ Auto overlap
-    if overlap is None:
-        overlap = int(chunk_size * 0.15)
-
-    overlap = max(120, min(overlap, int(chunk_size * 0.30)))
+    chunk_size, overlap = _resolve_sizes(total_len, chunk_size, overlap, min_chunk, max_chunk)
 
     chunks = []
     start = 0
 
-    while start < total_len and len(chunks) < max_chunks:
+    while start < total_len and (max_chunks is None or len(chunks) < max_chunks):
         end = start + chunk_size
         chunk = text[start:end].strip()
 
@@ -51,3 +70,299 @@ def chunk_text(
         start = end - overlap
 
     return chunks
+
+
+class _PageSpans:
+    """Maps offsets in the rolling chunk buffer back to (page_no, offset in page)."""
+
+    def __init__(self):
+        self.segments = []  # [page_no, start, end] in buffer coordinates
+
+    def add(self, page_no: int, start: int, length: int):
+        self.segments.append([page_no, start, start + length])
+
+    def shift(self, by: int):
+        for seg in self.segments:
+            seg[1] -= by
+            seg[2] -= by
+        self.segments = [seg for seg in self.segments if seg[2] > 0]
+
+    def locate(self, pos: int):
+        for page_no, start, end in self.segments:
+            if pos < end:
+                return page_no, max(0, pos - start)
+        page_no, start, end = self.segments[-1]
+        return page_no, end - start
+
+
+def _make_chunk(buffer: str, end: int, spans: _PageSpans, start: int = 0):
+    raw = buffer[start:end]
+    content = raw.strip()
+    if not content:
+        return None
+
+    start += len(raw) - len(raw.lstrip())
+    stop = start + len(content)
+    page_start, char_start = spans.locate(start)
+    page_end, char_end = spans.locate(stop - 1)
+
+    return {
+        "content": content,
+        "page_start": page_start,
+        "char_start": char_start,
+        "page_end": page_end,
+        "char_end": char_end + 1
+    }
+
+
+def iter_chunks(
+    pages,
+    total_pages: int | None = None,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+    min_chunk: int = 900,
+    max_chunk: int = 1800,
+    max_chunks: int | None = None
+):
+    """
+    Streaming version of chunk_text over (page_no, text) pairs.
+
+    - Only the current window of text is kept in memory
+    - overlap is carried across page boundaries
+    - if chunk_size not given, it is picked from the first page
+      length x total_pages (estimated document length)
+    - yields {content, page_start, char_start, page_end, char_end};
+      char offsets are relative to their page's text
+    """
+    buffer = ""
+    spans = _PageSpans()
+    emitted = 0
+    fresh = 0  # chars in buffer not yet part of an emitted chunk
+
+    for page_no, page_text in pages:
+        if not page_text:
+            continue
+
+        if chunk_size is None or overlap is None:
+            estimated_len = len(page_text) * (total_pages or 1)
+            chunk_size, overlap = _resolve_sizes(estimated_len, chunk_size, overlap, min_chunk, max_chunk)
+
+        spans.add(page_no, len(buffer), len(page_text))
+        buffer += page_text + "\n"
+        fresh += len(page_text) + 1
+
+        while len(buffer) >= chunk_size:
+            chunk = _make_chunk(buffer, chunk_size, spans)
+            if chunk:
+                yield chunk
+                emitted += 1
+                if max_chunks is not None and emitted >= max_chunks:
+                    return
+
+            buffer = buffer[chunk_size - overlap:]
+            spans.shift(chunk_size - overlap)
+            fresh = min(fresh, len(buffer) - overlap)
+
+    # ✅ Tail: skip it if it only repeats the previous chunk's overlap
+    if fresh > 0 or emitted == 0:
+        chunk = _make_chunk(buffer, len(buffer), spans) if buffer else None
+        if chunk:
+            yield chunk
+
+
+# -----------------------------
+# Structure-aware chunking
+# -----------------------------
+# ~4 chars per token for Gemini on English text; good enough for budgeting
+TOKEN_CHARS = 4
+
+# Sentence ends (plus closing quotes/brackets) and blank-line paragraph breaks.
+# A terminator only ends a sentence when whitespace and a non-lowercase character
+# (or the end of the text) follow, so decimals (3.14), versions (v2.3.1), URLs
+# (www.example.com) and abbreviations before lowercase words ("e.g. the") stay whole.
+# Compiled once; every chunker pass is a single finditer over new text.
+_BOUNDARY_RE = re.compile(r"(?:(?<=[.!?])[\"')\]]*(?=\s+[^a-z\s]|\s*$)[ \t]*\n?|\n[ \t]*\n)\s*")
+_WORD_RE = re.compile(r"[a-z0-9]{3,}")
+
+STOPWORDS = frozenset(
+    "the and for are but not you all any can her was one our out has have had this that with "
+    "from they will would there their what about which when were been into than them then "
+    "these those its also more such only other some may".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / TOKEN_CHARS)
+
+
+def _terms(text: str) -> Counter:
+    return Counter(w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS)
+
+
+def _cohesion(a: Counter, b: Counter) -> float:
+    """Cosine similarity of term counts (cheap lexical stand-in for topic similarity)."""
+    if not a or not b:
+        return 0.0
+    dot = sum(count * b[term] for term, count in a.items() if term in b)
+    norm = math.sqrt(sum(v * v for v in a.values())) * math.sqrt(sum(v * v for v in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def _split_long(start: int, end: int, buffer: str, max_chars: int):
+    """Hard-split an oversized sentence at whitespace, falling back to max_chars."""
+    while end - start > max_chars:
+        cut = buffer.rfind(" ", start + max_chars // 2, start + max_chars)
+        if cut == -1:
+            cut = start + max_chars
+        yield start, cut
+        start = cut
+    yield start, end
+
+
+def iter_structured_chunks(
+    pages,
+    max_tokens: int = 400,
+    min_tokens: int | None = None,
+    overlap_sentences: int = 0,
+    semantic: bool = False,
+    semantic_threshold: float = 0.08,
+    max_chunks: int | None = None
+):
+    """
+    Structure-aware streaming chunker over (page_no, text) pairs.
+
+    - Splits only on sentence / paragraph boundaries (never mid-word),
+      packing whole sentences up to a token budget (max_tokens)
+    - Prefers to close a chunk at a paragraph break once it is min_tokens
+      full (default 80% of max_tokens)
+    - No overlap by default (overlap_sentences repeats up to the last N sentences,
+      as many as fit in max_tokens together with the next one)
+    - semantic=True also closes a chunk (once min_tokens full) when the next
+      sentence shares little vocabulary with it, so chunks follow topics
+    - Same output as iter_chunks: {content, page_start, char_start, page_end, char_end}
+    """
+    max_chars = max_tokens * TOKEN_CHARS
+    min_chars = (min_tokens if min_tokens is not None else int(max_tokens * 0.8)) * TOKEN_CHARS
+
+    buffer = ""
+    spans = _PageSpans()
+    segments = []        # closed sentences of the open chunk: (start, end, is_paragraph_end)
+    scan_pos = 0         # boundaries before this offset are already segmented
+    chunk_terms = Counter()
+    emitted = 0
+    carried = 0          # leading segments repeated from the previous chunk (overlap)
+
+    def chunk_len():
+        return segments[-1][1] - segments[0][0] if segments else 0
+
+    def close_chunk():
+        nonlocal segments, chunk_terms, emitted, carried
+        chunk = _make_chunk(buffer, segments[-1][1], spans, start=segments[0][0])
+        keep = segments[-overlap_sentences:] if overlap_sentences else []
+        segments = list(keep)
+        carried = len(keep)
+        chunk_terms = sum((_terms(buffer[a:b]) for a, b, _ in keep), Counter()) if semantic else Counter()
+        if chunk:
+            emitted += 1
+        return chunk
+
+    def fit_carry(end):
+        """Drops the oldest overlap sentences until they plus buffer[..end] fit in max_chars."""
+        nonlocal segments, chunk_terms, carried
+        drop = 0
+        while drop < carried and end - segments[drop][0] > max_chars:
+            drop += 1
+        if drop:
+            segments = segments[drop:]
+            carried -= drop
+            if semantic:
+                chunk_terms = sum((_terms(buffer[a:b]) for a, b, _ in segments), Counter())
+
+    def add_segment(start, end, is_para):
+        """Returns a finished chunk (or None) after adding buffer[start:end]."""
+        done = None
+        seg_terms = _terms(buffer[start:end]) if semantic else None
+
+        # A chunk holding only the previous chunk's overlap is never closed (it would repeat it)
+        if len(segments) > carried:
+            size = chunk_len()
+            too_big = end - segments[0][0] > max_chars
+            topic_shift = (
+                semantic and size >= min_chars
+                and _cohesion(chunk_terms, seg_terms) < semantic_threshold
+            )
+            if too_big or topic_shift:
+                done = close_chunk()
+        fit_carry(end)
+
+        segments.append((start, end, is_para))
+        if semantic:
+            chunk_terms.update(seg_terms)
+
+        # ✅ A paragraph break is a natural place to stop once reasonably full
+        if done is None and is_para and chunk_len() >= min_chars:
+            done = close_chunk()
+        return done
+
+    def trim():
+        nonlocal buffer, segments, scan_pos
+        cut = segments[0][0] if segments else scan_pos
+        if cut > 0:
+            buffer = buffer[cut:]
+            spans.shift(cut)
+            segments = [(a - cut, b - cut, p) for a, b, p in segments]
+            scan_pos -= cut
+
+    def consume(upto_end: bool):
+        """Segment buffer[scan_pos:] and yield finished chunks."""
+        nonlocal scan_pos
+        bounds = [(m.end(), m.group(0).count("\n") >= 2) for m in _BOUNDARY_RE.finditer(buffer, scan_pos)]
+        if upto_end and (not bounds or bounds[-1][0] < len(buffer)):
+            bounds.append((len(buffer), True))
+
+        for end, is_para in bounds:
+            if end <= scan_pos:
+                continue
+            for a, b in _split_long(scan_pos, end, buffer, max_chars):
+                chunk = add_segment(a, b, is_para and b == end)
+                if chunk:
+                    yield chunk
+            scan_pos = end
+
+    for page_no, page_text in pages:
+        if not page_text:
+            continue
+
+        spans.add(page_no, len(buffer), len(page_text))
+        buffer += page_text + "\n"
+
+        for chunk in consume(upto_end=False):
+            yield chunk
+            if max_chunks is not None and emitted >= max_chunks:
+                return
+        trim()
+
+    for chunk in consume(upto_end=True):
+        yield chunk
+        if max_chunks is not None and emitted >= max_chunks:
+            return
+
+    # ✅ Tail: skip it if it only repeats the previous chunk's overlap
+    if len(segments) > carried:
+        chunk = close_chunk()
+        if chunk:
+            yield chunk
+
+
+def chunk_pages(pages, total_pages: int | None = None, strategy: str | None = None, **options):
+    """Streaming chunker used by ingestion; picks the engine by strategy."""
+    strategy = strategy or CHUNKING_STRATEGY
+
+    if strategy == "fixed":
+        return iter_chunks(pages, total_pages=total_pages, **options)
+    if strategy in ("structured", "semantic"):
+        options.setdefault("max_tokens", CHUNK_MAX_TOKENS)
+        options.setdefault("semantic", strategy == "semantic")
+        return iter_structured_chunks(pages, **options)
+
+    raise ValueError(f"❌ Unknown CHUNKING_STRATEGY: {strategy}")
@@ -0,0 +1,129 @@
+import os
+import logging
+
+from app.services.chat.chunking import estimate_tokens, TOKEN_CHARS
+from app.services.chat.keyword_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+# ✅ Prompt context budget (estimated tokens) and MMR trade-off (1.0 = relevance only)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# Chunks whose terms overlap this much with an already picked one are dropped outright
+DUPLICATE_JACCARD = 0.9
+OVERLAP_PROBE_CHARS = 48
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b (chunk overlap)."""
+    probe = b[:OVERLAP_PROBE_CHARS]
+    if not probe:
+        return 0
+
+    pos = a.find(probe, max(0, len(a) - len(b)))
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return len(a) - pos
+        pos = a.find(probe, pos + 1)
+    return 0
+
+
+def _merge_neighbours(results: list[dict]) -> list[dict]:
+    """
+    Joins hits on consecutive chunks of the same document into one passage,
+    writing the text they share (chunk overlap) once. The passage keeps the
+    rank of its best chunk.
+    """
+    ranked = [{**r, "rank": rank} for rank, r in enumerate(results)]
+    ordered = sorted(
+        (r for r in ranked if r.get("chunk_index") is not None),
+        key=lambda r: (str(r.get("pdf_id")), r["chunk_index"])
+    )
+
+    passages = [r for r in ranked if r.get("chunk_index") is None]
+    current = None
+    for r in ordered:
+        if (
+            current is not None
+            and current.get("pdf_id") == r.get("pdf_id")
+            and r["chunk_index"] == current["last_index"] + 1
+        ):
+            shared = _overlap(current["text"], r["text"])
+            current["text"] = current["text"] + ("\n" if not shared else "") + r["text"][shared:]
+            current["last_index"] = r["chunk_index"]
+            current["rank"] = min(current["rank"], r["rank"])
+            current["page_start"] = current.get("page_start") or r.get("page_start")
+            current["page_end"] = r.get("page_end") or current.get("page_end")
+            if r.get("similarity") is not None:
+                current["similarity"] = max(current.get("similarity") or 0.0, r["similarity"])
+            continue
+
+        current = {**r, "last_index": r["chunk_index"]}
+        passages.append(current)
+
+    passages.sort(key=lambda p: p["rank"])
+    return passages
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _mmr(passages: list[dict], lambda_: float) -> list[dict]:
+    """
+    Maximal marginal relevance over the ranked passages. Relevance comes from
+    the retrieval rank (keyword-only and fused hits have no comparable score),
+    redundancy is the term-set Jaccard overlap with what was already picked.
+    """
+    n = len(passages)
+    candidates = [(p, 1.0 - p["rank"] / max(n, 1), set(tokenize(p["text"]))) for p in passages]
+    picked, picked_terms = [], []
+
+    while candidates:
+        best, best_score = None, None
+        for i, (p, relevance, terms) in enumerate(candidates):
+            redundancy = max((_jaccard(terms, t) for t in picked_terms), default=0.0)
+            if redundancy >= DUPLICATE_JACCARD:
+                continue
+            score = lambda_ * relevance - (1 - lambda_) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = i, score
+
+        if best is None:
+            break
+        p, _, terms = candidates.pop(best)
+        picked.append(p)
+        picked_terms.append(terms)
+
+    return picked
+
+
+def build_context(results: list[dict], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  lambda_: float = CONTEXT_MMR_LAMBDA) -> list[dict]:
+    """
+    Context assembly between retrieval and generation: merge overlapping
+    neighbours, reorder with MMR, then keep passages while they fit the token
+    budget. The best passage is always kept (cut to the budget if needed).
+    """
+    if not results:
+        return []
+
+    passages = _mmr(_merge_neighbours(results), lambda_)
+
+    packed, used = [], 0
+    for p in passages:
+        tokens = estimate_tokens(p["text"])
+        if used + tokens <= token_budget:
+            packed.append(p)
+            used += tokens
+        elif not packed:
+            text = p["text"][:token_budget * TOKEN_CHARS]
+            packed.append({**p, "text": text})
+            used = estimate_tokens(text)
+
+    before = sum(estimate_tokens(r["text"]) for r in results)
+    logger.debug(f"Context: {len(results)} chunks / ~{before} tokens -> {len(packed)} passages / ~{used} tokens")
+    return packed
@@ -0,0 +1,251 @@
+import os
+import re
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.extensions import supabase, get_async_supabase
+from app.services.chat.chunking import estimate_tokens, TOKEN_CHARS
+from app.services.chat.gemini_client import generate_text, agenerate_text
+
+logger = logging.getLogger(__name__)
+
+# ✅ Rolling memory per conversation (pdf + user): a compact summary of older
+# turns plus the most recent ones, packed into a fixed token budget
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "1") == "1"
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "4"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "800"))
+MEMORY_SUMMARY_TOKENS = int(os.getenv("MEMORY_SUMMARY_TOKENS", "300"))
+
+# Long answers only matter for what they were about
+ANSWER_CHARS = 600
+
+# ✅ Questions that lean on earlier turns. Only clear signals count, so ordinary
+# questions skip the rewrite call:
+# - opening with a connector ("and ...", "what about ...")
+_FOLLOWUP_LEAD_RE = re.compile(r"^\s*(and|but|also|so|or|then|what about|how about|aur)\b", re.IGNORECASE)
+# - pronouns with nothing to resolve them in the question itself
+_FOLLOWUP_PRONOUN_RE = re.compile(
+    r"\b(it|its|they|them|their|iska|uska|iske|uske|isme|usme|isko|usko)\b", re.IGNORECASE
+)
+# - a demonstrative standing alone ("what is that?", "does this apply ...") rather
+#   than introducing a noun ("this document", "that section")
+_FOLLOWUP_DEMONSTRATIVE_RE = re.compile(
+    r"\b(this|that|these|those)\b(?=\s*(?:[?.!,]|$)|\s+(?:is|are|was|were|mean|means|meant|do|does|did|"
+    r"say|says|said|work|works|apply|applies|refer|refers|include|includes|happen|happened)\b)",
+    re.IGNORECASE
+)
+# - references into an earlier answer ("the second point", "point 3", "the latter", "you mentioned")
+_FOLLOWUP_REFERENCE_RE = re.compile(
+    r"\b(?:(?:the\s+)?(?:first|second|third|fourth|fifth|last|previous|above|same)\s+"
+    r"(?:one|ones|point|points|item|items|option|step|part|answer|bullet|reason|example)s?|"
+    r"(?:point|item|step|option|bullet)\s*#?\d+|the\s+(?:former|latter|above)|"
+    r"you\s+(?:said|mentioned|listed)|(?:mentioned|said)\s+(?:above|earlier|before))\b",
+    re.IGNORECASE
+)
+_FOLLOWUP_RES = (_FOLLOWUP_LEAD_RE, _FOLLOWUP_PRONOUN_RE, _FOLLOWUP_DEMONSTRATIVE_RE, _FOLLOWUP_REFERENCE_RE)
+
+REWRITE_PROMPT = """
+Rewrite the user's follow-up question as one standalone question that can be
+understood without the conversation (resolve "it", "that", "the second point", ...).
+Keep the user's language. Reply with the question only.
+
+Conversation:
+{history}
+
+Follow-up question:
+{question}
+
+Standalone question:
+"""
+
+FOLD_PROMPT = """
+Update the running summary of a conversation about a PDF with the new turns below.
+Keep the topics, entities, numbers and conclusions the user may refer back to.
+At most {words} words, plain text, no markdown.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:
+"""
+
+_fold_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-memory")
+_folding = set()
+_folding_lock = threading.Lock()
+
+
+def _turn_text(turn: dict) -> str:
+    answer = turn["a"]
+    if len(answer) > ANSWER_CHARS:
+        answer = answer[:ANSWER_CHARS].rstrip() + " ..."
+    return f"User: {turn['q']}\nAssistant: {answer}"
+
+
+class ConversationMemory:
+    """Summary of folded turns + the turns after it (oldest first, each with id / created_at)."""
+
+    def __init__(self, summary: str = "", turns: list[dict] | None = None):
+        self.summary = summary or ""
+        self.turns = turns or []
+
+    def __bool__(self):
+        return bool(self.summary or self.turns)
+
+    def render(self, token_budget: int = MEMORY_TOKEN_BUDGET) -> str:
+        """Summary first, then as many of the newest turns as fit the budget."""
+        parts = []
+        used = 0
+        if self.summary:
+            summary = self.summary[:MEMORY_SUMMARY_TOKENS * TOKEN_CHARS]
+            parts.append(f"Summary of earlier turns:\n{summary}")
+            used = estimate_tokens(summary)
+
+        recent = []
+        for turn in reversed(self.turns):
+            text = _turn_text(turn)
+            tokens = estimate_tokens(text)
+            if used + tokens > token_budget:
+                break
+            recent.append(text)
+            used += tokens
+
+        parts.extend(reversed(recent))
+        return "\n\n".join(parts)
+
+
+def _memory_query(db, pdf_id: str, user_id: str):
+    return db.table("chat_memory") \
+        .select("summary, summarized_until, summarized_id") \
+        .eq("pdf_id", pdf_id) \
+        .eq("user_id", user_id) \
+        .limit(1)
+
+
+def _recent_query(db, pdf_id: str, user_id: str):
+    return db.table("chat_history") \
+        .select("id, question, answer, created_at") \
+        .eq("pdf_id", pdf_id) \
+        .eq("user_id", user_id) \
+        .order("created_at", desc=True) \
+        .order("id", desc=True) \
+        .limit(2 * MEMORY_RECENT_TURNS)
+
+
+async def aload_memory(pdf_id: str, user_id: str) -> ConversationMemory:
+    """Memory row + the latest turns not folded into it yet (at most 2 * MEMORY_RECENT_TURNS), fetched concurrently."""
+    if not MEMORY_ENABLED:
+        return ConversationMemory()
+
+    db = await get_async_supabase()
+    row, res = await asyncio.gather(
+        _memory_query(db, pdf_id, user_id).execute(),
+        _recent_query(db, pdf_id, user_id).execute()
+    )
+    return _build_memory(row.data, res.data)
+
+
+def _build_memory(memory_rows, recent_rows) -> ConversationMemory:
+    memory_row = memory_rows[0] if memory_rows else {}
+    until = memory_row.get("summarized_until")
+    cursor = (datetime.fromisoformat(until), memory_row.get("summarized_id")) if until else None
+
+    turns = []
+    for r in reversed(recent_rows or []):
+        if cursor and (datetime.fromisoformat(r["created_at"]), r["id"]) <= cursor:
+            continue
+        if r["answer"].startswith("❌"):
+            continue
+        turns.append({"id": r["id"], "q": r["question"], "a": r["answer"], "created_at": r["created_at"]})
+
+    return ConversationMemory(memory_row.get("summary"), turns)
+
+
+def looks_like_followup(question: str) -> bool:
+    return any(pattern.search(question) for pattern in _FOLLOWUP_RES)
+
+
+async def arewrite_followup(question: str, memory: ConversationMemory, api_key=None) -> str:
+    """
+    Standalone version of a follow-up question for retrieval. Questions that
+    don't look like follow-ups (or a failed rewrite) are returned unchanged.
+    """
+    if not memory or not looks_like_followup(question):
+        return question
+
+    try:
+        rewritten = await agenerate_text(_rewrite_prompt(question, memory), api_key=api_key)
+    except Exception as e:
+        logger.warning(f"Follow-up rewrite failed, searching with the original question: {e}")
+        return question
+
+    return _standalone(question, rewritten)
+
+
+def _rewrite_prompt(question: str, memory: ConversationMemory) -> str:
+    return REWRITE_PROMPT.format(history=memory.render(MEMORY_TOKEN_BUDGET // 2), question=question)
+
+
+def _standalone(question: str, rewritten: str) -> str:
+    lines = (rewritten or "").strip().splitlines()
+    standalone = lines[0].strip().strip('"') if lines else ""
+    if not standalone or len(standalone) > 4 * len(question) + 200:
+        return question
+
+    logger.debug(f"Follow-up rewritten: {question!r} -> {standalone!r}")
+    return standalone
+
+
+def _fold(pdf_id: str, user_id: str, summary: str, turns: list[dict], api_key=None):
+    key = (pdf_id, user_id)
+    try:
+        prompt = FOLD_PROMPT.format(
+            words=int(MEMORY_SUMMARY_TOKENS * 0.75),
+            summary=summary or "(none yet)",
+            turns="\n\n".join(_turn_text(t) for t in turns)
+        )
+        new_summary = generate_text(prompt, api_key=api_key).strip()
+
+        supabase.table("chat_memory").upsert({
+            "pdf_id": pdf_id,
+            "user_id": user_id,
+            "summary": new_summary[:MEMORY_SUMMARY_TOKENS * TOKEN_CHARS],
+            "summarized_until": turns[-1]["created_at"],
+            "summarized_id": turns[-1]["id"],
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }).execute()
+
+    except Exception as e:
+        # Best effort: the turns stay unfolded and are retried after the next turn
+        logger.warning(f"Conversation memory update failed for pdf {pdf_id}: {e}")
+
+    finally:
+        with _folding_lock:
+            _folding.discard(key)
+
+
+def remember_turn(pdf_id: str, user_id: str, memory: ConversationMemory, turn: dict, api_key=None):
+    """
+    Called once a turn is saved. When 2 * MEMORY_RECENT_TURNS turns are
+    unfolded, the oldest MEMORY_RECENT_TURNS are folded into the summary in
+    the background, so the prompt never carries more than that.
+    """
+    if not MEMORY_ENABLED or memory is None:
+        return
+
+    turns = memory.turns + ([turn] if not turn["a"].startswith("❌") else [])
+    if len(turns) < 2 * MEMORY_RECENT_TURNS:
+        return
+
+    key = (pdf_id, user_id)
+    with _folding_lock:
+        if key in _folding:
+            return
+        _folding.add(key)
+
+    _fold_pool.submit(_fold, pdf_id, user_id, memory.summary, turns[:MEMORY_RECENT_TURNS], api_key)
@@ -0,0 +1,187 @@
+import os
+import asyncio
+import json
+import hashlib
+import logging
+import threading
+
+from app.core.cache import LRUCache
+from app.core.extensions import supabase
+from app.services.chat.gemini_client import EMBEDDING_MODEL, prepare_embed_text, get_embedding, aget_embedding
+
+logger = logging.getLogger(__name__)
+
+# ✅ In-process tier (entries are ~6KB each for 768 floats)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "5000"))
+
+# ✅ Persistent tier: Supabase table `embedding_cache` shared by all workers
+EMBED_CACHE_PERSIST = os.getenv("EMBED_CACHE_PERSIST", "1") == "1"
+
+# ✅ Query embeddings (chat questions): memory only, short-lived
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2000"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+
+# ✅ Fixed internal queries: embedded once (shared via the persistent tier), never expire
+FIXED_QUERIES = frozenset({"overall document summary"})
+
+LOOKUP_BATCH_SIZE = 200  # ✅ keeps the `in` filter URL short
+
+# ✅ Significant digits per value when sending vectors to pgvector (it stores float32,
+# so JSON's 17-digit doubles mostly carry noise); 7 keeps cosine scores unchanged to ~1e-6
+EMBED_WIRE_DIGITS = int(os.getenv("EMBED_WIRE_DIGITS", "7"))
+
+def normalize_text(text: str) -> str:
+    """Cache key text: exactly what the embed request sends."""
+    return prepare_embed_text(text)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _parse_embedding(value):
+    # ✅ PostgREST returns pgvector columns as "[0.1,0.2,...]" strings
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def vector_literal(embedding) -> str:
+    """pgvector text form "[v1,v2,...]" with EMBED_WIRE_DIGITS digits: ~2x smaller inserts than JSON floats."""
+    return "[" + ",".join(f"{v:.{EMBED_WIRE_DIGITS}g}" for v in embedding) + "]"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, sha256(text)).
+    Memory LRU first, then the Supabase table, then the API.
+    """
+
+    def __init__(self, model: str = EMBEDDING_MODEL, maxsize: int = EMBED_CACHE_SIZE, persist: bool = EMBED_CACHE_PERSIST):
+        self.model = model
+        self.persist = persist
+        self.memory = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.persistent_hits = 0
+        self.misses = 0
+
+    def get_many(self, texts: list[str]) -> list:
+        """Returns one embedding (or None on miss) per text."""
+        hashes = [content_hash(t) for t in texts]
+        found = {}
+
+        for h in set(hashes):
+            emb = self.memory.get((self.model, h))
+            if emb is not None:
+                found[h] = emb
+
+        missing = [h for h in set(hashes) if h not in found]
+        if missing and self.persist:
+            stored = self._load(missing)
+            for h, emb in stored.items():
+                self.memory.set((self.model, h), emb)
+            found.update(stored)
+
+            with self._lock:
+                self.persistent_hits += len(stored)
+
+        with self._lock:
+            self.misses += len({h for h in hashes if h not in found})
+
+        return [found.get(h) for h in hashes]
+
+    def put_many(self, texts: list[str], embeddings: list):
+        rows = {}
+        for text, emb in zip(texts, embeddings):
+            h = content_hash(text)
+            self.memory.set((self.model, h), emb)
+            rows[h] = {"model": self.model, "content_hash": h, "embedding": vector_literal(emb)}
+
+        if rows and self.persist:
+            try:
+                supabase.table("embedding_cache") \
+                    .upsert(list(rows.values()), on_conflict="model,content_hash", ignore_duplicates=True) \
+                    .execute()
+            except Exception as e:
+                # ✅ Cache writes must never fail an upload
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    def _load(self, hashes: list[str]) -> dict:
+        found = {}
+        try:
+            for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                res = supabase.table("embedding_cache") \
+                    .select("content_hash, embedding") \
+                    .eq("model", self.model) \
+                    .in_("content_hash", hashes[i:i + LOOKUP_BATCH_SIZE]) \
+                    .execute()
+
+                for row in res.data or []:
+                    found[row["content_hash"]] = _parse_embedding(row["embedding"])
+        except Exception as e:
+            logger.warning(f"Embedding cache read failed: {e}")
+        return found
+
+    def stats(self) -> dict:
+        memory = self.memory.stats()
+        return {
+            "model": self.model,
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+        }
+
+
+embedding_cache = EmbeddingCache()
+
+
+query_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+_fixed_embeddings = {}
+
+
+def get_query_embedding(text: str, api_key=None):
+    """
+    Embedding for a search query, skipping the API round trip when possible:
+    fixed internal queries are computed once per model, user questions are
+    kept in a TTL LRU keyed by (model, normalized text). The key is the exact
+    text sent to the API: case changes the embedding, so it stays in the key.
+    """
+    normalized = normalize_text(text)
+    key = (EMBEDDING_MODEL, normalized)
+
+    if normalized in FIXED_QUERIES:
+        emb = _fixed_embeddings.get(key)
+        if emb is None:
+            emb = embedding_cache.get_many([normalized])[0]
+            if emb is None:
+                emb = get_embedding(normalized, api_key=api_key)
+                embedding_cache.put_many([normalized], [emb])
+            _fixed_embeddings[key] = emb
+        return emb
+
+    emb = query_cache.get(key)
+    if emb is None:
+        emb = get_embedding(normalized, api_key=api_key)
+        query_cache.set(key, emb)
+    return emb
+
+
+async def aget_query_embedding(text: str, api_key=None):
+    """Async get_query_embedding (same caches)."""
+    normalized = normalize_text(text)
+    key = (EMBEDDING_MODEL, normalized)
+
+    if normalized in FIXED_QUERIES:
+        # Computed once per process; the persistent tier lookup is sync
+        return await asyncio.to_thread(get_query_embedding, text, api_key)
+
+    emb = query_cache.get(key)
+    if emb is None:
+        emb = await aget_embedding(normalized, api_key=api_key)
+        query_cache.set(key, emb)
+    return emb
+
+
+def cache_stats() -> dict:
+    return {**embedding_cache.stats(), "query_cache": query_cache.stats()}
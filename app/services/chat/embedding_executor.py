@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.cache import LRUCache
+from app.services.chat.gemini_client import (
+    EMBED_BATCH_SIZE,
+    GENAI_CLIENT_POOL_SIZE,
+    GeminiAPIError,
+    get_embeddings,
+    is_rate_limit_error,
+)
+from app.services.chat.embedding_cache import embedding_cache, content_hash
+
+logger = logging.getLogger(__name__)
+
+# ✅ Per API key limits (each key has its own quota on Google's side)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "150"))
+
+# ✅ Small first batch so the first chunks become searchable quickly
+FIRST_BATCH_SIZE = 10
+
+# ✅ Retry on 429 / ResourceExhausted with jittered exponential backoff
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "1.0"))
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", "30.0"))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+
+class KeyLimiter:
+    """Concurrency slots + request rate for a single API key."""
+
+    def __init__(self, concurrency: int, requests_per_minute: float):
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+        rate = max(requests_per_minute, 1.0) / 60.0
+        self.bucket = TokenBucket(rate=rate, capacity=max(1, concurrency))
+
+
+# ✅ Bounded like the client pool: an evicted key starts over with a fresh bucket
+_limiters = LRUCache(GENAI_CLIENT_POOL_SIZE)
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_key=None) -> KeyLimiter:
+    """One limiter per API key, so a heavy user only throttles themselves."""
+    # ✅ Never keep raw keys around as dict keys
+    key_id = hashlib.sha256((api_key or "__default__").encode()).hexdigest()
+
+    with _limiters_lock:
+        limiter = _limiters.get(key_id)
+        if limiter is None:
+            limiter = KeyLimiter(EMBED_CONCURRENCY, EMBED_REQUESTS_PER_MINUTE)
+            _limiters.set(key_id, limiter)
+        return limiter
+
+
+def _backoff_delay(attempt: int) -> float:
+    # ✅ Full jitter: uniform(0, min(cap, base * 2^attempt))
+    return random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * (2 ** attempt)))
+
+
+def call_with_limits(func, api_key=None, what: str = "Embedding"):
+    """
+    Runs func() under the API key's limiter (rate + concurrency), retrying
+    429s with backoff. Every ingestion-time call on a user's key goes through
+    here (embedding batches, summary map / reduce), so they share its quota.
+    """
+    limiter = get_limiter(api_key)
+    attempt = 0
+    while True:
+        limiter.bucket.acquire()
+        with limiter.slots:
+            try:
+                return func()
+            except GeminiAPIError as e:
+                if not is_rate_limit_error(e) or attempt >= EMBED_MAX_RETRIES:
+                    raise
+                error = e
+
+        # ✅ Sleep outside the slot so other batches can use it
+        delay = _backoff_delay(attempt)
+        attempt += 1
+        logger.warning(f"{what} rate limited, retry {attempt}/{EMBED_MAX_RETRIES} in {delay:.1f}s: {error}")
+        time.sleep(delay)
+
+
+def _embed_batch(batch: list[str], api_key):
+    return call_with_limits(lambda: get_embeddings(batch, api_key=api_key, batch_size=len(batch)), api_key)
+
+
+def _embed_batch_cached(batch: list[str], api_key):
+    """Only texts missing from the embedding cache hit the API (deduplicated)."""
+    embeddings = embedding_cache.get_many(batch)
+
+    misses = {}
+    for text, emb in zip(batch, embeddings):
+        if emb is None:
+            misses.setdefault(content_hash(text), text)
+
+    if misses:
+        texts = list(misses.values())
+        fresh = _embed_batch(texts, api_key)
+        embedding_cache.put_many(texts, fresh)
+
+        by_hash = dict(zip(misses.keys(), fresh))
+        embeddings = [
+            emb if emb is not None else by_hash[content_hash(text)]
+            for text, emb in zip(batch, embeddings)
+        ]
+
+    return embeddings
+
+
+def _iter_batches(items, batch_size: int):
+    """Lazily group an iterable; the first batch is small so indexing starts early."""
+    it = iter(items)
+    size = min(batch_size, FIRST_BATCH_SIZE)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+        size = batch_size
+
+
+def embed_batches_concurrently(items, api_key=None, batch_size: int | None = None, get_text=None):
+    """
+    Embed items (any iterable, consumed lazily) in batches on a thread pool,
+    bounded by the key's limiter. get_text(item) gives the text to embed
+    (default: the item itself).
+    Cached embeddings are reused, so repeated chunks cost no API calls.
+    Yields (batch_items, embeddings) per batch, in input order.
+    """
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+
+    # ✅ Keep a bounded window in flight so memory stays flat for big PDFs
+    window = max(1, EMBED_CONCURRENCY) * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(max_workers=max(1, EMBED_CONCURRENCY)) as pool:
+        try:
+            for batch in _iter_batches(items, batch_size):
+                texts = [get_text(item) for item in batch] if get_text else batch
+                pending.append((batch, pool.submit(_embed_batch_cached, texts, api_key)))
+
+                # ✅ Hand back finished batches as soon as they are ready (in order)
+                while pending and (len(pending) >= window or pending[0][1].done()):
+                    done_batch, future = pending.popleft()
+                    yield done_batch, future.result()
+
+            while pending:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+
+        finally:
+            for _, future in pending:
+                future.cancel()
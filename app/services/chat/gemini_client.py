@@ -1,12 +1,36 @@
 import os
+import re
+import hashlib
+import logging
+import threading
+import httpx
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
+
+from app.core.cache import LRUCache
+from app.core import aio
 
 load_dotenv()
 
 # ✅ Safe limit: prevents embedding API errors on huge text
 MAX_EMBED_CHARS = 10000
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# ✅ Texts per embed_content request (Gemini accepts up to 100)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+# ✅ One long-lived client (and HTTP connection pool) per API key
+GENAI_CLIENT_POOL_SIZE = int(os.getenv("GENAI_CLIENT_POOL_SIZE", "64"))
+GENAI_KEEPALIVE_CONNECTIONS = int(os.getenv("GENAI_KEEPALIVE_CONNECTIONS", "8"))
+GENAI_KEEPALIVE_SECONDS = float(os.getenv("GENAI_KEEPALIVE_SECONDS", "60"))
+GENAI_CLIENT_CLOSE_DELAY = 30  # seconds; lets in-flight calls on an evicted client finish
+
+logger = logging.getLogger(__name__)
+
 try:
     from google.api_core import exceptions
     GoogleAPIExceptions = (exceptions.ResourceExhausted, exceptions.InvalidArgument, exceptions.Unauthenticated)
@@ -23,60 +47,240 @@ class GeminiAPIError(Exception):
         self.original_error = original_error
 
 
+def _close_client(key_id, client):
+    """Evicted clients are closed a little later, in case a call is still using them."""
+    def close():
+        try:
+            client.close()
+            # Async side (used by async views) lives on the shared I/O loop
+            if aio.loop_started():
+                aio.run(client.aio.aclose(), timeout=10)
+        except Exception as e:
+            logger.warning(f"Closing GenAI client failed: {e}")
+
+    timer = threading.Timer(GENAI_CLIENT_CLOSE_DELAY, close)
+    timer.daemon = True
+    timer.start()
+
+
+_clients = LRUCache(GENAI_CLIENT_POOL_SIZE, on_evict=_close_client)
+_clients_lock = threading.Lock()
+
+
+def _new_client(key: str):
+    limits = httpx.Limits(
+        max_keepalive_connections=GENAI_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=GENAI_KEEPALIVE_SECONDS
+    )
+    return genai.Client(
+        api_key=key,
+        http_options=types.HttpOptions(client_args={"limits": limits}, async_client_args={"limits": limits})
+    )
+
+
 def get_client(api_key=None):
-    """Returns a GenAI client using user key or system default."""
+    """Returns a pooled GenAI client using user key or system default."""
     key = api_key or os.getenv("GEMINI_API_KEY")
     if not key:
         raise GeminiAPIError("No Gemini API Key provided. Please add one in your Profile.")
-    return genai.Client(api_key=key)
 
+    # ✅ Never keep raw keys around as dict keys
+    key_id = hashlib.sha256(key.encode()).hexdigest()
 
-def get_embedding(text: str, api_key=None):
-    safe_text = (text or "").strip()
+    client = _clients.get(key_id)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key_id)
+            if client is None:
+                client = _new_client(key)
+                _clients.set(key_id, client)
+    return client
+
+
+def client_pool_stats() -> dict:
+    return _clients.stats()
+
+
+def prepare_embed_text(text: str) -> str:
+    """The exact text sent to the embedding API (also the embedding caches' key)."""
+    safe_text = _WHITESPACE_RE.sub(" ", (text or "").strip())
     if len(safe_text) > MAX_EMBED_CHARS:
         safe_text = safe_text[:MAX_EMBED_CHARS]
+    return safe_text
+
+
+def _map_embedding_error(e):
+    """Map known Google exceptions to readable errors."""
+    if exceptions and isinstance(e, exceptions.ResourceExhausted):
+        return GeminiAPIError("⚠️ Daily Quota Exceeded. Please use a different API Key or try again tomorrow.", original_error=e)
+    if exceptions and isinstance(e, exceptions.InvalidArgument):
+        return GeminiAPIError("❌ Invalid API Key. Please update it in your Profile.")
+    if exceptions and isinstance(e, exceptions.Unauthenticated):
+        return GeminiAPIError("❌ API Key authentication failed. Key might be expired.")
+    # Fallback
+    return GeminiAPIError(f"Gemini API Error: {str(e)}", original_error=e)
+
+
+def is_rate_limit_error(err) -> bool:
+    """True if a GeminiAPIError was caused by a quota / 429 response."""
+    original = getattr(err, "original_error", None)
+    if original is None:
+        return False
+    if exceptions and isinstance(original, exceptions.ResourceExhausted):
+        return True
+    # google-genai raises its own APIError with the HTTP status in .code
+    return getattr(original, "code", None) == 429
+
+
+def get_embedding(text: str, api_key=None):
+    safe_text = prepare_embed_text(text)
 
     try:
         client = get_client(api_key)
         res = client.models.embed_content(
-            model="models/text-embedding-004", # ✅ Explicit model path
+            model=EMBEDDING_MODEL, # ✅ Explicit model path
             contents=safe_text
         )
         return res.embeddings[0].values
     
     except GoogleAPIExceptions as e:
-         # Map known Google exceptions to readable errors
-        if exceptions and isinstance(e, exceptions.ResourceExhausted):
-            raise GeminiAPIError("⚠️ Daily Quota Exceeded. Please use a different API Key or try again tomorrow.")
-        if exceptions and isinstance(e, exceptions.InvalidArgument):
-            raise GeminiAPIError("❌ Invalid API Key. Please update it in your Profile.")
-        if exceptions and isinstance(e, exceptions.Unauthenticated):
-            raise GeminiAPIError("❌ API Key authentication failed. Key might be expired.")
-        # Fallback
-        raise GeminiAPIError(f"Gemini API Error: {str(e)}", original_error=e)
+        raise _map_embedding_error(e)
+
+    except Exception as e:
+        raise GeminiAPIError(f"Embedding Error: {str(e)}", original_error=e)
+
+
+async def aget_embedding(text: str, api_key=None):
+    """Async get_embedding (the pooled client's .aio side)."""
+    safe_text = prepare_embed_text(text)
+
+    try:
+        client = get_client(api_key)
+        res = await client.aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=safe_text
+        )
+        return res.embeddings[0].values
+
+    except GoogleAPIExceptions as e:
+        raise _map_embedding_error(e)
 
     except Exception as e:
         raise GeminiAPIError(f"Embedding Error: {str(e)}", original_error=e)
 
 
+def get_embeddings(texts: list[str], api_key=None, batch_size: int | None = None):
+    """
+    Embed many texts with one embed_content request per batch.
+    Returns embeddings in the same order as texts.
+    """
+    embeddings = []
+    for batch in iter_embedding_batches(texts, api_key=api_key, batch_size=batch_size):
+        embeddings.extend(batch)
+    return embeddings
+
+
+def iter_embedding_batches(texts: list[str], api_key=None, batch_size: int | None = None):
+    """
+    Yields one list of embeddings per request, so callers can
+    start storing results before the whole document is embedded.
+    """
+    batch_size = max(1, batch_size or EMBED_BATCH_SIZE)
+    if not texts:
+        return
+
+    client = get_client(api_key)
+
+    for start in range(0, len(texts), batch_size):
+        batch = [prepare_embed_text(t) for t in texts[start:start + batch_size]]
+
+        try:
+            res = client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=batch
+            )
+        except GoogleAPIExceptions as e:
+            raise _map_embedding_error(e)
+        except Exception as e:
+            raise GeminiAPIError(f"Embedding Error: {str(e)}", original_error=e)
+
+        if len(res.embeddings) != len(batch):
+            raise GeminiAPIError(
+                f"Embedding Error: expected {len(batch)} embeddings, got {len(res.embeddings)}"
+            )
+
+        yield [emb.values for emb in res.embeddings]
+
+
+GENERATION_MODEL = "gemini-2.5-flash-lite"
+
+
+def _map_generation_error(e):
+    if isinstance(e, GeminiAPIError):
+        return e
+    if GoogleAPIExceptions and isinstance(e, GoogleAPIExceptions):
+        # Map known Google exceptions to readable errors
+        if isinstance(e, exceptions.ResourceExhausted):
+            return GeminiAPIError("⚠️ Daily Quota Exceeded. Please use a different API Key or try again tomorrow.", original_error=e)
+        if isinstance(e, exceptions.InvalidArgument):
+            return GeminiAPIError("❌ Invalid API Key. Please update it in your Profile.")
+        if isinstance(e, exceptions.Unauthenticated):
+            return GeminiAPIError("❌ API Authentication failed. Please check your key.")
+        return GeminiAPIError(f"Gemini API Error: {str(e)}", original_error=e)
+    return GeminiAPIError(f"Generation Error: {str(e)}", original_error=e)
+
+
 def generate_text(prompt: str, api_key=None):
     try:
         client = get_client(api_key)
         res = client.models.generate_content(
-            model="gemini-2.5-flash-lite",
+            model=GENERATION_MODEL,
             contents=prompt
         )
         return res.text
-        
-    except GoogleAPIExceptions as e:
-         # Map known Google exceptions to readable errors
-        if exceptions and isinstance(e, exceptions.ResourceExhausted):
-            raise GeminiAPIError("⚠️ Daily Quota Exceeded. Please use a different API Key or try again tomorrow.")
-        if exceptions and isinstance(e, exceptions.InvalidArgument):
-            raise GeminiAPIError("❌ Invalid API Key. Please update it in your Profile.")
-        if exceptions and isinstance(e, exceptions.Unauthenticated):
-            raise GeminiAPIError("❌ API Authentication failed. Please check your key.")
-        raise GeminiAPIError(f"Gemini API Error: {str(e)}", original_error=e)
 
     except Exception as e:
-        raise GeminiAPIError(f"Generation Error: {str(e)}", original_error=e)
+        raise _map_generation_error(e)
+
+
+def generate_text_stream(prompt: str, api_key=None):
+    """Like generate_text, but yields text pieces as the model produces them."""
+    try:
+        client = get_client(api_key)
+        for chunk in client.models.generate_content_stream(
+            model=GENERATION_MODEL,
+            contents=prompt
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    except Exception as e:
+        raise _map_generation_error(e)
+
+
+async def agenerate_text(prompt: str, api_key=None):
+    try:
+        client = get_client(api_key)
+        res = await client.aio.models.generate_content(
+            model=GENERATION_MODEL,
+            contents=prompt
+        )
+        return res.text
+
+    except Exception as e:
+        raise _map_generation_error(e)
+
+
+async def agenerate_text_stream(prompt: str, api_key=None):
+    """Async generate_text_stream."""
+    try:
+        client = get_client(api_key)
+        async for chunk in await client.aio.models.generate_content_stream(
+            model=GENERATION_MODEL,
+            contents=prompt
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    except Exception as e:
+        raise _map_generation_error(e)
@@ -0,0 +1,103 @@
+import os
+import asyncio
+import logging
+
+from app.services.chat.vector_store import fetch_chunks, asearch_in_vector_db, afetch_chunks
+from app.services.chat.keyword_index import get_keyword_index, exact_terms, tokenize
+
+logger = logging.getLogger(__name__)
+
+# ✅ Reciprocal-rank fusion constant (60 is the usual choice)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# ✅ Short queries made of IDs / codes are answered from BM25 alone (no embedding call)
+KEYWORD_ONLY_MAX_TERMS = int(os.getenv("KEYWORD_ONLY_MAX_TERMS", "6"))
+
+
+def _keyword_results(pdf_id: str, hits: list[tuple[int, float]], rows: dict | None = None) -> list[dict]:
+    if rows is None:
+        rows = fetch_chunks(pdf_id, [chunk_index for chunk_index, _ in hits])
+    results = []
+    for chunk_index, score in hits:
+        row = rows.get(chunk_index)
+        if row:
+            results.append({**row, "similarity": None, "keyword_score": score})
+    return results
+
+
+def is_keyword_query(query: str) -> bool:
+    """A few terms, at least one of them an identifier (code, number, version, acronym)."""
+    return bool(exact_terms(query)) and len(tokenize(query)) <= KEYWORD_ONLY_MAX_TERMS
+
+
+def keyword_only_search(pdf_id: str, query: str, top_k: int = 8) -> list[dict] | None:
+    """
+    BM25-only results when the query is keyword-heavy (a few terms including
+    an identifier) and the best chunk contains every identifier.
+    Returns None when the query should go through hybrid search instead.
+    """
+    if not is_keyword_query(query):
+        return None
+
+    required = exact_terms(query)
+    index = get_keyword_index(pdf_id)
+    if index is None:
+        return None
+
+    hits = index.search(query, top_k=top_k)
+    if not hits or not index.contains_all(hits[0][0], required):
+        return None
+
+    return _keyword_results(pdf_id, hits) or None
+
+
+def _fuse(vector_results: list[dict], keyword_hits: list[tuple[int, float]], top_k: int):
+    """
+    Reciprocal-rank fusion. Returns (ranked chunk indexes, vector results by
+    chunk index, keyword hits among the ranked ones whose text still has to be fetched).
+    """
+    fused = {}
+    by_index = {}
+    for rank, r in enumerate(vector_results):
+        fused[r["chunk_index"]] = 1.0 / (RRF_K + rank + 1)
+        by_index[r["chunk_index"]] = r
+    for rank, (chunk_index, _) in enumerate(keyword_hits):
+        fused[chunk_index] = fused.get(chunk_index, 0.0) + 1.0 / (RRF_K + rank + 1)
+
+    ranked = sorted(fused, key=fused.get, reverse=True)[:top_k]
+
+    # ✅ Only chunks that the vector search did not return need their text fetched
+    missing = [(i, s) for i, s in keyword_hits if i in ranked and i not in by_index]
+    return ranked, by_index, missing
+
+
+async def akeyword_only_search(pdf_id: str, query: str, top_k: int = 8) -> list[dict] | None:
+    """Async keyword_only_search (the BM25 index is an in-process cache; loaded in a thread on a miss)."""
+    if not is_keyword_query(query):
+        return None
+    return await asyncio.to_thread(keyword_only_search, pdf_id, query, top_k)
+
+
+async def ahybrid_search(pdf_id: str, query: str, top_k: int = 8, api_key=None, query_embedding=None) -> list[dict]:
+    """
+    Vector search fused with the PDF's BM25 index via reciprocal-rank fusion.
+    Results keep the vector "similarity" (None for keyword-only hits).
+    Falls back to plain vector search for PDFs without a keyword index.
+    The vector search and the keyword index load run concurrently.
+    """
+    vector_results, index = await asyncio.gather(
+        asearch_in_vector_db(pdf_id, query, top_k=top_k, api_key=api_key, query_embedding=query_embedding),
+        asyncio.to_thread(get_keyword_index, pdf_id)
+    )
+
+    keyword_hits = index.search(query, top_k=top_k) if index is not None else []
+    if not keyword_hits:
+        return vector_results
+
+    ranked, by_index, missing = _fuse(vector_results, keyword_hits, top_k)
+    if missing:
+        rows = await afetch_chunks(pdf_id, [chunk_index for chunk_index, _ in missing])
+        for r in _keyword_results(pdf_id, missing, rows):
+            by_index[r["chunk_index"]] = r
+
+    return [by_index[i] for i in ranked if i in by_index]
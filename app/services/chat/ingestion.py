@@ -0,0 +1,169 @@
+import time
+import logging
+from datetime import datetime, timezone
+
+from app.core.extensions import supabase
+from app.services.jobs import JobProgress, get_job_queue, claim_job, update_job, INGEST_WORKER_BUDGET
+from app.services.supabase_service import get_api_key
+from app.services.chat.pdf_utils import iter_pdf_pages, count_pdf_pages
+from app.services.chat.chunking import chunk_pages
+from app.services.chat.vector_store import add_to_vector_db, delete_pdf_chunks
+from app.services.chat.page_store import PageTextWriter, save_pages, load_pages
+from app.services.chat.summarizer import SUMMARY_ENABLED, SummaryBuilder, save_summaries
+from app.services.chat.keyword_index import KeywordIndexBuilder, save_keyword_index
+
+logger = logging.getLogger(__name__)
+
+
+def _count_chunks(chunks, progress: JobProgress):
+    """Pass-through that reports chunks_total once the chunker is exhausted."""
+    count = 0
+    for chunk in chunks:
+        count += 1
+        yield chunk
+    progress.update(chunks_total=count)
+
+
+def run_ingestion(job_id: str, pdf_id: str, user_id: str, storage_path: str, file_bytes: bytes | None = None, api_key=None):
+    """
+    extract -> chunk -> embed -> insert for one uploaded PDF.
+    file_bytes / api_key are optional so out-of-process queues can
+    pass only ids; they are then loaded from Storage / the users table.
+    """
+    progress = JobProgress(job_id)
+    summary_builder = None
+    progress.update(status="extracting", started_at=datetime.now(timezone.utc).isoformat())
+
+    try:
+        if file_bytes is None:
+            file_bytes = supabase.storage.from_("pdfs").download(storage_path)
+
+        if api_key is None:
+            api_key = get_api_key(user_id)
+
+        # ✅ Streaming pipeline: pages are parsed lazily, chunked across page
+        # boundaries, and embedded + inserted in fixed-size windows.
+        # Memory stays flat and the first chunks are searchable while parsing continues.
+        pages_total = count_pdf_pages(file_bytes)
+        progress.update(status="indexing", pages_total=pages_total, pages_done=0, chunks_embedded=0)
+
+        # ✅ Page texts are compressed as they stream by and stored once,
+        # so re-chunking never has to run pypdf again
+        page_writer = PageTextWriter()
+        pages = page_writer.tap(iter_pdf_pages(
+            file_bytes,
+            on_page=lambda done, total: progress.update(pages_done=done)
+        ))
+        chunks = _count_chunks(chunk_pages(pages, total_pages=pages_total), progress)
+
+        # ✅ BM25 keyword index is built from the same chunk stream (same chunk_index order)
+        keyword_index = KeywordIndexBuilder()
+        chunks = keyword_index.tap(chunks)
+
+        # ✅ Map step of the document summary runs in the background as chunks stream by
+        summary_builder = SummaryBuilder(api_key=api_key) if SUMMARY_ENABLED else None
+        if summary_builder:
+            chunks = summary_builder.tap(chunks)
+
+        # ✅ Store chunks into Supabase pgvector table (with user key)
+        add_to_vector_db(
+            pdf_id, user_id, chunks, api_key=api_key,
+            on_progress=lambda stored: progress.update(chunks_embedded=stored)
+        )
+
+        save_pages(pdf_id, page_writer)
+        save_keyword_index(pdf_id, keyword_index)
+
+        # ✅ Mark as fully indexed (makes it eligible for dedup)
+        supabase.table("pdf_files").update({
+            "indexed_at": datetime.now(timezone.utc).isoformat()
+        }).eq("id", pdf_id).execute()
+
+        if summary_builder:
+            progress.update(status="summarizing")
+            _build_summaries(pdf_id, summary_builder)
+            summary_builder = None
+
+        progress.update(status="done")
+
+    except Exception as e:
+        logger.error(f"Ingestion job {job_id} failed for pdf {pdf_id}: {e}", exc_info=True)
+        progress.update(status="failed", error=str(e))
+
+    finally:
+        if summary_builder:
+            summary_builder.close()
+
+
+def _build_summaries(pdf_id: str, builder: SummaryBuilder):
+    """Reduce step + store. A failed summary never fails the (already searchable) PDF."""
+    try:
+        summaries = builder.build()
+        if summaries:
+            save_summaries(pdf_id, *summaries)
+    except Exception as e:
+        logger.warning(f"Summary generation failed for pdf {pdf_id}: {e}")
+
+
+def reindex_pdf(pdf_id: str, user_id: str, api_key=None, **chunk_options) -> int:
+    """
+    Re-chunk + re-embed a PDF from its stored page texts (no pypdf run).
+    chunk_options are passed to chunk_pages (strategy, max_tokens, ...).
+    Unchanged chunks hit the embedding cache. Returns chunks stored.
+    """
+    page_texts = load_pages(pdf_id)
+    if page_texts is None:
+        raise ValueError(f"No stored page text for pdf {pdf_id}; re-upload it to extract pages.")
+
+    pages = ((i, text) for i, text in enumerate(page_texts, start=1))
+    keyword_index = KeywordIndexBuilder()
+    chunks = keyword_index.tap(chunk_pages(pages, total_pages=len(page_texts), **chunk_options))
+
+    # ✅ Clearing indexed_at also invalidates cached answers (match_cached_answer)
+    supabase.table("pdf_files").update({"indexed_at": None}).eq("id", pdf_id).execute()
+
+    delete_pdf_chunks(pdf_id)
+    stored = add_to_vector_db(pdf_id, user_id, chunks, api_key=api_key)
+    save_keyword_index(pdf_id, keyword_index)
+
+    supabase.table("pdf_files").update({
+        "indexed_at": datetime.now(timezone.utc).isoformat()
+    }).eq("id", pdf_id).execute()
+
+    return stored
+
+
+def run_queued_ingestions(time_budget: float = INGEST_WORKER_BUDGET) -> int:
+    """
+    Worker for the "supabase" queue: claims jobs one at a time and runs them
+    here until none is left or the time budget is spent. Returns jobs run.
+    A job cut off by the platform timeout is claimed again later; its chunks
+    are cleared first and the already embedded ones come from the embedding cache.
+    """
+    deadline = time.monotonic() + time_budget
+    ran = 0
+
+    while time.monotonic() < deadline:
+        job = claim_job()
+        if job is None:
+            break
+
+        pdf = supabase.table("pdf_files").select("storage_path").eq("id", job["pdf_id"]).limit(1).execute()
+        if not pdf.data:
+            update_job(job["id"], status="failed", error="PDF not found")
+            continue
+
+        if job["attempts"] > 1:
+            delete_pdf_chunks(job["pdf_id"])
+
+        run_ingestion(job["id"], job["pdf_id"], job["user_id"], pdf.data[0]["storage_path"])
+        ran += 1
+
+    return ran
+
+
+def enqueue_ingestion(job_id: str, pdf_id: str, user_id: str, storage_path: str, file_bytes: bytes | None = None, api_key=None):
+    get_job_queue().submit(
+        run_ingestion, job_id, pdf_id, user_id, storage_path,
+        file_bytes=file_bytes, api_key=api_key
+    )
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import zlib
+import math
+import base64
+import logging
+from collections import Counter
+
+from app.core.cache import LRUCache
+from app.core.extensions import supabase
+from app.services.chat.chunking import STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+ENCODING = "bm25-v1+zlib+json"
+
+# ✅ BM25 parameters (standard defaults)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# ✅ Loaded indexes are kept per process; TTL picks up re-indexing done elsewhere
+KEYWORD_INDEX_CACHE_SIZE = int(os.getenv("KEYWORD_INDEX_CACHE_SIZE", "64"))
+KEYWORD_INDEX_CACHE_TTL = int(os.getenv("KEYWORD_INDEX_CACHE_TTL", "600"))
+
+# ✅ Terms keep inner "-_./" so IDs, codes and versions (ERR-4021, v2.3) stay whole
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_ACRONYM_RE = re.compile(r"\b[A-Z][A-Z0-9]{1,}\b")
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        t for t in _TOKEN_RE.findall(text.lower())
+        if t not in STOPWORDS and (len(t) > 1 or t.isdigit())
+    ]
+
+
+def exact_terms(query: str) -> set[str]:
+    """Query terms that look like identifiers: codes, numbers, versions, acronyms."""
+    tokens = set(tokenize(query))
+    terms = {t for t in tokens if any(c.isdigit() for c in t) or re.search(r"[-_./]", t)}
+    terms.update(a.lower() for a in _ACRONYM_RE.findall(query) if a.lower() in tokens)
+    return terms
+
+
+class KeywordIndexBuilder:
+    """
+    Builds a per-PDF BM25 inverted index while the ingestion pipeline
+    streams chunks by (in chunk_index order).
+    """
+
+    def __init__(self):
+        self.postings = {}   # term -> [[chunk_index, ...], [tf, ...]]
+        self.lengths = []    # term count per chunk
+
+    def tap(self, chunks):
+        """Pass-through for chunks (str or dict with "content") that indexes every chunk."""
+        for chunk in chunks:
+            self.add(chunk["content"] if isinstance(chunk, dict) else chunk)
+            yield chunk
+
+    def add(self, text: str):
+        chunk_index = len(self.lengths)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(chunk_index)
+            tfs.append(tf)
+        self.lengths.append(sum(terms.values()))
+
+    def finish(self) -> bytes:
+        # ✅ Chunk ids are delta-encoded: postings are sorted, so deltas stay small
+        terms = {}
+        for term, (docs, tfs) in self.postings.items():
+            deltas = [docs[0]] + [b - a for a, b in zip(docs, docs[1:])]
+            terms[term] = [deltas, tfs]
+
+        payload = {"lengths": self.lengths, "terms": terms}
+        return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 6)
+
+
+class KeywordIndex:
+    """Read side of a stored BM25 index."""
+
+    def __init__(self, lengths: list[int], terms: dict):
+        self.lengths = lengths
+        self.terms = terms
+        self.count = len(lengths)
+        self.avg_length = (sum(lengths) / self.count) if self.count else 0.0
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "KeywordIndex":
+        payload = json.loads(zlib.decompress(data).decode("utf-8"))
+        return cls(payload["lengths"], payload["terms"])
+
+    def _postings(self, term: str):
+        entry = self.terms.get(term)
+        if not entry:
+            return
+        chunk_index = 0
+        for delta, tf in zip(*entry):
+            chunk_index += delta
+            yield chunk_index, tf
+
+    def search(self, query: str, top_k: int = 8) -> list[tuple[int, float]]:
+        """Returns [(chunk_index, bm25_score)], best first."""
+        scores = {}
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if not entry:
+                continue
+            df = len(entry[0])
+            idf = math.log(1 + (self.count - df + 0.5) / (df + 0.5))
+            for chunk_index, tf in self._postings(term):
+                norm = 1 - BM25_B + BM25_B * self.lengths[chunk_index] / (self.avg_length or 1.0)
+                scores[chunk_index] = scores.get(chunk_index, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def contains_all(self, chunk_index: int, terms) -> bool:
+        return all(chunk_index in dict(self._postings(term)) for term in terms)
+
+
+_loaded = LRUCache(KEYWORD_INDEX_CACHE_SIZE, ttl=KEYWORD_INDEX_CACHE_TTL)
+_MISSING = object()
+
+
+def save_keyword_index(pdf_id: str, builder: KeywordIndexBuilder):
+    data = builder.finish()
+    supabase.table("pdf_keyword_index").upsert({
+        "pdf_id": pdf_id,
+        "chunk_count": len(builder.lengths),
+        "encoding": ENCODING,
+        "data": base64.b64encode(data).decode("ascii")
+    }).execute()
+    _loaded.pop(pdf_id)
+    logger.info(f"Keyword index for pdf {pdf_id}: {len(builder.postings)} terms, {len(data)} bytes")
+
+
+def get_keyword_index(pdf_id: str) -> KeywordIndex | None:
+    """Lazily loads (and caches) a PDF's keyword index; None for PDFs indexed before it existed."""
+    index = _loaded.get(pdf_id)
+    if index is not None:
+        return None if index is _MISSING else index
+
+    res = supabase.table("pdf_keyword_index") \
+        .select("encoding, data") \
+        .eq("pdf_id", pdf_id) \
+        .limit(1) \
+        .execute()
+
+    index = _MISSING
+    if res.data and res.data[0]["encoding"] == ENCODING:
+        index = KeywordIndex.from_bytes(base64.b64decode(res.data[0]["data"]))
+
+    _loaded.set(pdf_id, index)
+    return None if index is _MISSING else index
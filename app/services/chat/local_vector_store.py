@@ -0,0 +1,318 @@
+import os
+import json
+import shutil
+import logging
+import threading
+
+import numpy as np
+
+from app.core.cache import LRUCache
+from app.services.chat.vector_store import VectorStore, LIBRARY_SEARCH_DOCUMENTS
+
+logger = logging.getLogger(__name__)
+
+# ✅ One matrix per PDF on local disk, memory-mapped and searched in-process
+VECTOR_LOCAL_DIR = os.getenv("VECTOR_LOCAL_DIR", os.path.join("instance", "vectors"))
+VECTOR_LOCAL_DTYPE = os.getenv("VECTOR_LOCAL_DTYPE", "float32")   # float32 | float16 | int8
+VECTOR_LOCAL_CACHE_SIZE = int(os.getenv("VECTOR_LOCAL_CACHE_SIZE", "32"))  # hot PDFs kept open
+
+# ✅ Ingestion writes segments of this many rows (searchable as soon as each lands),
+# merged into the final matrix when the PDF is done; memory stays at one segment
+VECTOR_LOCAL_SEGMENT_ROWS = int(os.getenv("VECTOR_LOCAL_SEGMENT_ROWS", "256"))
+
+# Document centroids (library search ranking) are tiny, so many more stay cached
+CENTROID_CACHE_SIZE = 4096
+
+INT8_SCALE = 127.0
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalIndex:
+    """
+    A loaded PDF: embedding matrices (rows unit length, maybe quantized) + chunk
+    metadata. A finished PDF has one matrix; one still being ingested has one per segment.
+    """
+
+    def __init__(self, matrices: list[np.ndarray], chunks: list[dict]):
+        self.matrices = matrices
+        self.chunks = chunks
+        self.by_index = {c["chunk_index"]: c for c in chunks}
+
+    def centroid(self) -> np.ndarray:
+        total = sum(np.asarray(m, dtype=np.float32).sum(axis=0) for m in self.matrices)
+        return _normalize(total)
+
+    def search(self, query_embedding, top_k: int) -> list[dict]:
+        if not len(self.chunks):
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        parts = []
+        for matrix in self.matrices:
+            part = matrix @ query
+            parts.append(part / INT8_SCALE if matrix.dtype == np.int8 else part)
+        scores = np.concatenate(parts)
+
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+
+        return [
+            {
+                "text": self.chunks[i]["content"],
+                "similarity": float(scores[i]),
+                "chunk_index": self.chunks[i]["chunk_index"],
+                "page_start": self.chunks[i].get("page_start"),
+                "page_end": self.chunks[i].get("page_end")
+            }
+            for i in best
+        ]
+
+
+class _LocalWriter:
+    """Buffers at most one segment; the first one is written right away so search starts early."""
+
+    def __init__(self, store: "LocalVectorStore", pdf_id: str, segment_rows: int = VECTOR_LOCAL_SEGMENT_ROWS):
+        self.store = store
+        self.pdf_id = pdf_id
+        self.segment_rows = max(1, segment_rows)
+        self.segments = 0
+        self.total = None
+        self.embeddings = []
+        self.chunks = []
+
+    def add(self, rows: list[dict]):
+        for row in rows:
+            self.embeddings.append(np.asarray(row["embedding"], dtype=np.float32))
+            self.chunks.append({
+                "content": row["content"],
+                "chunk_index": row["chunk_index"],
+                "page_start": row.get("page_start"),
+                "page_end": row.get("page_end")
+            })
+        if len(self.chunks) >= self.segment_rows or (self.segments == 0 and self.chunks):
+            self._flush()
+
+    def _flush(self):
+        if not self.chunks:
+            return
+        matrix = _normalize(np.vstack(self.embeddings))
+        self.total = matrix.sum(axis=0) if self.total is None else self.total + matrix.sum(axis=0)
+        self.store.write_segment(self.pdf_id, self.segments, matrix, self.chunks, _normalize(self.total))
+        self.segments += 1
+        self.embeddings, self.chunks = [], []
+
+    def close(self):
+        self._flush()
+        self.store.merge_segments(self.pdf_id)
+
+
+class LocalVectorStore(VectorStore):
+    """
+    NumPy backend: <dir>/<pdf_id>.npy (embeddings, float32 / float16 / int8)
+    plus <pdf_id>.json (chunk texts + page spans) and <pdf_id>.centroid.npy.
+    During ingestion rows land in <pdf_id>.part/ segments that are searchable
+    right away and merged into the final pair at the end. Search is a dot
+    product over the memory-mapped matrix; the most recently used PDFs stay open.
+    """
+
+    def __init__(self, directory: str = VECTOR_LOCAL_DIR, dtype: str = VECTOR_LOCAL_DTYPE,
+                 cache_size: int = VECTOR_LOCAL_CACHE_SIZE):
+        if dtype not in DTYPES:
+            raise ValueError(f"❌ Unknown VECTOR_LOCAL_DTYPE: {dtype}")
+        self.directory = directory
+        self.dtype = dtype
+        self._hot = LRUCache(cache_size)
+        self._centroids = LRUCache(CENTROID_CACHE_SIZE)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, pdf_id: str):
+        base = os.path.join(self.directory, str(pdf_id))
+        return base + ".npy", base + ".json"
+
+    def _part_dir(self, pdf_id: str) -> str:
+        return os.path.join(self.directory, f"{pdf_id}.part")
+
+    def _centroid_path(self, pdf_id: str) -> str:
+        return os.path.join(self.directory, f"{pdf_id}.centroid.npy")
+
+    def _quantize(self, matrix: np.ndarray) -> np.ndarray:
+        if self.dtype == "int8":
+            matrix = np.round(matrix * INT8_SCALE)
+        return matrix.astype(DTYPES[self.dtype])
+
+    def writer(self, pdf_id: str, user_id: str):
+        return _LocalWriter(self, pdf_id)
+
+    def write_segment(self, pdf_id: str, segment: int, matrix: np.ndarray, chunks: list[dict], centroid: np.ndarray):
+        part_dir = self._part_dir(pdf_id)
+        os.makedirs(part_dir, exist_ok=True)
+        base = os.path.join(part_dir, f"{segment:06d}")
+
+        # ✅ Chunks first, matrix last: a segment exists for readers once its .npy is in place
+        with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        os.replace(base + ".json.tmp", base + ".json")
+        with open(base + ".npy.tmp", "wb") as f:
+            np.save(f, self._quantize(matrix))
+
+        with self._lock:
+            os.replace(base + ".npy.tmp", base + ".npy")
+            self._hot.pop(pdf_id)
+        self._save_centroid(pdf_id, centroid)
+
+    def merge_segments(self, pdf_id: str):
+        """Streams the segments into the final matrix + JSON (one segment in memory at a time)."""
+        part_dir = self._part_dir(pdf_id)
+        segments = self._segment_names(part_dir)
+        npy_path, meta_path = self._paths(pdf_id)
+
+        shapes = [np.load(os.path.join(part_dir, name + ".npy"), mmap_mode="r").shape for name in segments]
+        rows = sum(shape[0] for shape in shapes)
+        dim = shapes[0][1] if shapes else 0
+
+        # ✅ Write to temp files, then swap in, so readers never see half a file
+        if not rows:
+            with open(npy_path + ".tmp", "wb") as f:
+                np.save(f, np.zeros((0, 0), dtype=DTYPES[self.dtype]))
+        else:
+            out = np.lib.format.open_memmap(npy_path + ".tmp", mode="w+", dtype=DTYPES[self.dtype], shape=(rows, dim))
+            at = 0
+            for name in segments:
+                part = np.load(os.path.join(part_dir, name + ".npy"), mmap_mode="r")
+                out[at:at + len(part)] = part
+                at += len(part)
+            out.flush()
+            del out
+
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(f'{{"dtype": {json.dumps(self.dtype)}, "chunks": [')
+            first = True
+            for name in segments:
+                with open(os.path.join(part_dir, name + ".json"), encoding="utf-8") as seg:
+                    for chunk in json.load(seg):
+                        f.write(("" if first else ", ") + json.dumps(chunk))
+                        first = False
+            f.write("]}")
+
+        with self._lock:
+            os.replace(npy_path + ".tmp", npy_path)
+            os.replace(meta_path + ".tmp", meta_path)
+            shutil.rmtree(part_dir, ignore_errors=True)
+            self._hot.pop(pdf_id)
+
+    @staticmethod
+    def _segment_names(part_dir: str) -> list[str]:
+        if not os.path.isdir(part_dir):
+            return []
+        return sorted(name[:-4] for name in os.listdir(part_dir) if name.endswith(".npy"))
+
+    def _save_centroid(self, pdf_id: str, centroid: np.ndarray):
+        path = self._centroid_path(pdf_id)
+        centroid = np.asarray(centroid, dtype=np.float32)
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, centroid)
+        os.replace(path + ".tmp", path)
+        self._centroids.set(pdf_id, centroid)
+
+    def _centroid(self, pdf_id: str) -> np.ndarray | None:
+        """Unit-length mean of the chunk vectors (document-level ranking for library search)."""
+        centroid = self._centroids.get(pdf_id)
+        if centroid is not None:
+            return centroid
+
+        path = self._centroid_path(pdf_id)
+        if os.path.exists(path):
+            centroid = np.load(path)
+            self._centroids.set(pdf_id, centroid)
+            return centroid
+
+        # PDFs stored before centroids were kept: computed once from the matrix
+        index = self._load(pdf_id)
+        if index is None or not len(index.chunks):
+            return None
+        centroid = index.centroid()
+        self._save_centroid(pdf_id, centroid)
+        return centroid
+
+    def _load(self, pdf_id: str) -> LocalIndex | None:
+        index = self._hot.get(pdf_id)
+        if index is not None:
+            return index
+
+        npy_path, meta_path = self._paths(pdf_id)
+        with self._lock:
+            if os.path.exists(npy_path):
+                matrices = [np.load(npy_path, mmap_mode="r")]
+                with open(meta_path, encoding="utf-8") as f:
+                    chunks = json.load(f)["chunks"]
+            else:
+                # Still being ingested: the segments written so far
+                part_dir = self._part_dir(pdf_id)
+                segments = self._segment_names(part_dir)
+                if not segments:
+                    return None
+                matrices, chunks = [], []
+                for name in segments:
+                    matrices.append(np.load(os.path.join(part_dir, name + ".npy"), mmap_mode="r"))
+                    with open(os.path.join(part_dir, name + ".json"), encoding="utf-8") as f:
+                        chunks.extend(json.load(f))
+
+        index = LocalIndex(matrices, chunks)
+        self._hot.set(pdf_id, index)
+        return index
+
+    def search(self, pdf_id: str, query_embedding, top_k: int) -> list[dict]:
+        index = self._load(pdf_id)
+        return index.search(query_embedding, top_k) if index else []
+
+    def search_library(self, user_id: str, pdf_ids: list[str], query_embedding, top_k: int) -> list[dict]:
+        # ✅ Rank documents by their stored centroids; only the best ones are opened
+        centroids = {pdf_id: self._centroid(pdf_id) for pdf_id in pdf_ids}
+        centroids = {pdf_id: c for pdf_id, c in centroids.items() if c is not None}
+        if not centroids:
+            return []
+
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        ranked = sorted(centroids, key=lambda pdf_id: float(centroids[pdf_id] @ query), reverse=True)
+
+        results = []
+        for pdf_id in ranked[:LIBRARY_SEARCH_DOCUMENTS]:
+            index = self._load(pdf_id)
+            if index is not None:
+                results.extend({**r, "pdf_id": pdf_id} for r in index.search(query, top_k))
+        results.sort(key=lambda r: r["similarity"], reverse=True)
+        return results[:top_k]
+
+    def fetch(self, pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+        index = self._load(pdf_id)
+        if index is None:
+            return {}
+
+        results = {}
+        for chunk_index in chunk_indexes:
+            chunk = index.by_index.get(chunk_index)
+            if chunk:
+                results[chunk_index] = {
+                    "text": chunk["content"],
+                    "chunk_index": chunk_index,
+                    "page_start": chunk.get("page_start"),
+                    "page_end": chunk.get("page_end")
+                }
+        return results
+
+    def delete(self, pdf_id: str):
+        with self._lock:
+            self._hot.pop(pdf_id)
+            self._centroids.pop(pdf_id)
+            for path in (*self._paths(pdf_id), self._centroid_path(pdf_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(self._part_dir(pdf_id), ignore_errors=True)
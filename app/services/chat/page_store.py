@@ -0,0 +1,64 @@
+import json
+import zlib
+import base64
+
+from app.core.extensions import supabase
+
+ENCODING = "zlib+json"
+
+
+class PageTextWriter:
+    """
+    Compresses page texts incrementally while the pipeline streams them,
+    so the raw text of the whole PDF never has to sit in memory.
+    """
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(level=6)
+        self._parts = []
+        self.page_count = 0
+
+    def tap(self, pages):
+        """Pass-through for (page_no, text) pairs that records every page."""
+        for page_no, text in pages:
+            self.add(text)
+            yield page_no, text
+
+    def add(self, text: str):
+        prefix = "[" if self.page_count == 0 else ","
+        self._parts.append(self._compressor.compress((prefix + json.dumps(text)).encode("utf-8")))
+        self.page_count += 1
+
+    def finish(self) -> bytes:
+        closing = "]" if self.page_count else "[]"
+        self._parts.append(self._compressor.compress(closing.encode("utf-8")))
+        self._parts.append(self._compressor.flush())
+        return b"".join(self._parts)
+
+
+def save_pages(pdf_id: str, writer: PageTextWriter):
+    """Persist extracted page texts (compressed) for later re-chunking / citations."""
+    supabase.table("pdf_pages").upsert({
+        "pdf_id": pdf_id,
+        "page_count": writer.page_count,
+        "encoding": ENCODING,
+        "data": base64.b64encode(writer.finish()).decode("ascii")
+    }).execute()
+
+
+def load_pages(pdf_id: str) -> list[str] | None:
+    """Returns page texts (index 0 = page 1), or None if never stored."""
+    res = supabase.table("pdf_pages") \
+        .select("encoding, data") \
+        .eq("pdf_id", pdf_id) \
+        .limit(1) \
+        .execute()
+
+    if not res.data:
+        return None
+
+    row = res.data[0]
+    if row["encoding"] != ENCODING:
+        raise ValueError(f"Unsupported page encoding: {row['encoding']}")
+
+    return json.loads(zlib.decompress(base64.b64decode(row["data"])).decode("utf-8"))
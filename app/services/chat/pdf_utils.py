@@ -1,26 +1,154 @@
-from pypdf import PdfReader
+import os
+import logging
+import threading
+import multiprocessing
 from io import BytesIO
+from collections import deque
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+# ✅ Process-pool extraction for big PDFs (pypdf is pure Python / CPU bound)
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+PDF_PAGES_PER_SHARD = 16
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+# Worker-side: reader for the document currently being extracted
+_worker_doc = (None, None)
+
+
+def _attach_shared_memory(name: str):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        # Older Pythons: spawned workers share the parent's resource tracker,
+        # so re-registering the (parent-owned) block is a no-op
+        return shared_memory.SharedMemory(name=name)
+
+
+def _extract_page_range(shm_name: str, size: int, start: int, end: int) -> list[str]:
+    """Runs in a worker process: bytes come from shared memory, not the task pickle."""
+    global _worker_doc
+
+    if _worker_doc[0] != shm_name:
+        shm = _attach_shared_memory(shm_name)
+        try:
+            data = bytes(shm.buf[:size])
+        finally:
+            shm.close()
+        _worker_doc = (shm_name, PdfReader(BytesIO(data)))
+
+    reader = _worker_doc[1]
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # ✅ spawn: forking a multi-threaded Flask process is not safe
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
+
+def _iter_pages_parallel(pdf_bytes: bytes, total: int, workers: int):
+    """Shard page ranges across worker processes, yield texts in page order."""
+    shm = shared_memory.SharedMemory(create=True, size=len(pdf_bytes))
+    pending = deque()
+    try:
+        shm.buf[:len(pdf_bytes)] = pdf_bytes
+        pool = _get_pool(workers)
+
+        shard = max(1, min(PDF_PAGES_PER_SHARD, -(-total // (workers * 4))))
+        ranges = iter(range(0, total, shard))
+        window = workers * 2  # ✅ bounded, so a slow consumer doesn't pile up text
+
+        def submit_next():
+            start = next(ranges, None)
+            if start is not None:
+                end = min(start + shard, total)
+                pending.append(pool.submit(_extract_page_range, shm.name, len(pdf_bytes), start, end))
+
+        for _ in range(window):
+            submit_next()
+
+        while pending:
+            texts = pending.popleft().result()
+            submit_next()
+            yield from texts
+
+    finally:
+        for future in pending:
+            future.cancel()
+        shm.close()
+        shm.unlink()
+
+
+def iter_pdf_pages(pdf_bytes: bytes, on_page=None, workers: int | None = None):
     """
-    Extract text directly from PDF bytes.
+    Lazily yield (page_no, text) for each page, 1-based.
+    on_page(pages_done, pages_total) is called after each page, if given.
+
+    Large PDFs are extracted on a process pool (workers, default
+    PDF_EXTRACT_WORKERS); small ones, or hosts without shared memory,
+    use the serial path.
     """
     reader = PdfReader(BytesIO(pdf_bytes))
-    text = ""
+    total = len(reader.pages)
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+
+    done = 0
+    if workers > 1 and total >= PDF_PARALLEL_MIN_PAGES:
+        try:
+            for text in _iter_pages_parallel(pdf_bytes, total, workers):
+                done += 1
+                yield done, text
+                if on_page:
+                    on_page(done, total)
+        except (OSError, BrokenProcessPool) as e:
+            # ✅ e.g. no /dev/shm on serverless: finish the remaining pages serially
+            logger.warning(f"Parallel PDF extraction unavailable, falling back to serial: {e}")
+            if isinstance(e, BrokenProcessPool):
+                _reset_pool()
+
+    for i in range(done, total):
+        yield i + 1, reader.pages[i].extract_text() or ""
+        if on_page:
+            on_page(i + 1, total)
+
 
-    for page in reader.pages:
-        extracted = page.extract_text()
-        if extracted:
-            text += extracted + "\n"
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    return len(PdfReader(BytesIO(pdf_bytes)).pages)
 
-    return text.strip()
+
+def extract_text_from_pdf_bytes(pdf_bytes: bytes, on_page=None) -> str:
+    """
+    Extract text directly from PDF bytes.
+    on_page(pages_done, pages_total) is called after each page, if given.
+    """
+    parts = [text for _, text in iter_pdf_pages(pdf_bytes, on_page=on_page) if text]
+    return "\n".join(parts).strip()
 
 
 def extract_text_from_pdf_path(pdf_path: str) -> str:
-    reader = PdfReader(pdf_path)
-    text = ""
-    for page in reader.pages:
-        extracted = page.extract_text()
-        if extracted:
-            text += extracted + "\n"
-    return text.strip()
+    with open(pdf_path, "rb") as f:
+        return extract_text_from_pdf_bytes(f.read())
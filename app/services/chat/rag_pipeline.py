@@ -1,16 +1,48 @@
-from app.services.chat.gemini_client import generate_text
+from app.services.chat.gemini_client import agenerate_text, agenerate_text_stream
 
-def generate_answer(question: str, context: str, api_key=None):
-    prompt = f"""
+
+def format_context(results: list[dict]) -> str:
+    """
+    Join retrieved chunks for the prompt, labelled with their pages for citations
+    (and with the document name when results span several PDFs).
+    """
+    parts = []
+    for r in results:
+        start, end = r.get("page_start"), r.get("page_end")
+        if start and end and start != end:
+            label = f"Pages {start}-{end}"
+        elif start:
+            label = f"Page {start}"
+        else:
+            label = None
+
+        if r.get("document"):
+            label = f"{r['document']}, {label}" if label else r["document"]
+
+        parts.append(f"[{label}]\n{r['text']}" if label else r["text"])
+    return "\n\n".join(parts)
+
+
+def build_answer_prompt(question: str, context: str, history: str | None = None) -> str:
+    conversation = ""
+    if history:
+        conversation = f"""
+Conversation so far (only to understand what the question refers to; facts come from the PDF context):
+{history}
+"""
+
+    return f"""
 You are a helpful PDF assistant.
 Answer ONLY using the provided PDF context.
 
 Rules:
 - Do NOT use markdown formatting like **bold**, headings, code blocks.
 - Write in clean plain text.
+- When the context has [Page N] labels, mention the page numbers you used, like (p. 4).
+- When the labels also name a document, mention it too, like (report.pdf, p. 4).
 - If answer is not in context, reply exactly:
 Is PDF me iska answer available nahi hai.
-
+{conversation}
 PDF Context:
 {context}
 
@@ -19,4 +51,21 @@ User Question:
 
 Answer:
 """
-    return generate_text(prompt, api_key=api_key).strip()
+
+
+async def agenerate_answer(question: str, context: str, api_key=None, history: str | None = None):
+    prompt = build_answer_prompt(question, context, history)
+    return (await agenerate_text(prompt, api_key=api_key)).strip()
+
+
+async def agenerate_answer_stream(question: str, context: str, api_key=None, history: str | None = None):
+    """Yields the answer as it is generated (leading whitespace dropped)."""
+    prompt = build_answer_prompt(question, context, history)
+    started = False
+    async for piece in agenerate_text_stream(prompt, api_key=api_key):
+        if not started:
+            piece = piece.lstrip()
+            if not piece:
+                continue
+            started = True
+        yield piece
@@ -0,0 +1,162 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.extensions import supabase, get_async_supabase
+from app.services.chat.gemini_client import generate_text
+from app.services.chat.embedding_executor import call_with_limits
+
+logger = logging.getLogger(__name__)
+
+# ✅ Map-reduce summaries built once at ingest (stored on pdf_files)
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "1") == "1"
+SUMMARY_WINDOW_CHARS = int(os.getenv("SUMMARY_WINDOW_CHARS", "24000"))   # chunk text per map call
+SUMMARY_REDUCE_CHARS = int(os.getenv("SUMMARY_REDUCE_CHARS", "24000"))   # notes per reduce call
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "3"))
+
+MAP_PROMPT = """
+You are summarizing one part of a longer PDF.
+Write concise plain-text bullet notes (lines starting with "- ") covering every
+key fact, argument, definition, number and conclusion in this part.
+Do NOT use markdown formatting like **bold**, headings, code blocks.
+
+PDF Part:
+{text}
+
+Notes:
+"""
+
+COMBINE_PROMPT = """
+Merge these notes from consecutive parts of a PDF into one set of concise
+plain-text bullet notes (lines starting with "- "). Keep every key point, drop repeats.
+Do NOT use markdown formatting like **bold**, headings, code blocks.
+
+Notes:
+{text}
+
+Merged notes:
+"""
+
+LONG_PROMPT = """
+Using these notes that cover the whole PDF, give a clean structured summary
+of the PDF in bullet points, in the order the document presents things.
+Do NOT use markdown formatting like **bold**, headings, code blocks.
+Write in clean plain text.
+
+Notes:
+{text}
+
+Summary:
+"""
+
+SHORT_PROMPT = """
+Give a short summary of this PDF in 6-8 bullet points, based on its full summary below.
+Do NOT use markdown formatting like **bold**, headings, code blocks.
+Write in clean plain text.
+
+Full summary:
+{text}
+
+Short summary:
+"""
+
+
+def _windows(texts: list[str], max_chars: int):
+    """Groups consecutive texts into windows of about max_chars."""
+    window, size = [], 0
+    for text in texts:
+        if window and size + len(text) > max_chars:
+            yield "\n\n".join(window)
+            window, size = [], 0
+        window.append(text)
+        size += len(text)
+    if window:
+        yield "\n\n".join(window)
+
+
+class SummaryBuilder:
+    """
+    Collects chunk texts while the ingestion pipeline streams them and runs the
+    map step in the background as each window fills, so only the notes (not
+    the whole document) are held in memory. build() does the reduce step.
+    """
+
+    def __init__(self, api_key=None, window_chars: int = SUMMARY_WINDOW_CHARS):
+        self.api_key = api_key
+        self.window_chars = window_chars
+        self._pool = ThreadPoolExecutor(max_workers=SUMMARY_CONCURRENCY, thread_name_prefix="summary")
+        self._futures = []
+        self._buffer = []
+        self._size = 0
+
+    def tap(self, chunks):
+        """Pass-through for chunks (str or dict with "content") that records every chunk."""
+        for chunk in chunks:
+            self.add(chunk["content"] if isinstance(chunk, dict) else chunk)
+            yield chunk
+
+    def add(self, text: str):
+        self._buffer.append(text)
+        self._size += len(text)
+        if self._size >= self.window_chars:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        window = "\n\n".join(self._buffer)
+        self._buffer, self._size = [], 0
+        self._futures.append(self._pool.submit(self._generate, MAP_PROMPT, window))
+
+    def _generate(self, template: str, text: str) -> str:
+        # ✅ Same per-key limiter / 429 backoff as the embedding batches running alongside
+        prompt = template.format(text=text)
+        return call_with_limits(lambda: generate_text(prompt, api_key=self.api_key), self.api_key, "Summary").strip()
+
+    def build(self) -> tuple[str, str] | None:
+        """Returns (short, long) summaries, or None for an empty document."""
+        try:
+            self._flush()
+            notes = [f.result() for f in self._futures]
+            if not notes:
+                return None
+
+            # ✅ Reduce until all notes fit into one prompt
+            while len(notes) > 1 and sum(len(n) for n in notes) > SUMMARY_REDUCE_CHARS:
+                groups = list(_windows(notes, SUMMARY_REDUCE_CHARS))
+                if len(groups) == len(notes):
+                    # Each note alone is too big to pair up; merge them two at a time
+                    groups = ["\n\n".join(notes[i:i + 2]) for i in range(0, len(notes), 2)]
+                notes = list(self._pool.map(lambda g: self._generate(COMBINE_PROMPT, g), groups))
+
+            summary_long = self._generate(LONG_PROMPT, "\n\n".join(notes))
+            summary_short = self._generate(SHORT_PROMPT, summary_long)
+            return summary_short, summary_long
+        finally:
+            self.close()
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def save_summaries(pdf_id: str, summary_short: str, summary_long: str):
+    supabase.table("pdf_files").update({
+        "summary_short": summary_short,
+        "summary_long": summary_long
+    }).eq("id", pdf_id).execute()
+
+
+async def aget_stored_summary(pdf_id: str, user_id: str, short: bool = False) -> str | None:
+    """Precomputed summary of the user's PDF, or None if it has not been built (yet)."""
+    column = "summary_short" if short else "summary_long"
+    db = await get_async_supabase()
+    res = await db.table("pdf_files") \
+        .select(column) \
+        .eq("id", pdf_id) \
+        .eq("user_id", user_id) \
+        .limit(1) \
+        .execute()
+
+    if not res.data:
+        return None
+    return res.data[0].get(column)
@@ -1,57 +1,360 @@
-from app.core.extensions import supabase
-from app.services.chat.gemini_client import get_embedding
+import os
+import math
+import asyncio
+import logging
+import threading
+from app.core.extensions import supabase, get_async_supabase
+from app.services.chat.embedding_executor import embed_batches_concurrently
+from app.services.chat.embedding_cache import cache_stats, get_query_embedding, aget_query_embedding, vector_literal
 
 BATCH_SIZE = 60  # ✅ safe batch insert size
 
+# ✅ "supabase" = pgvector tables + RPCs, "local" = NumPy matrices on disk (see local_vector_store.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "supabase")
 
-def add_to_vector_db(pdf_id: str, user_id: str, chunks: list[str], api_key=None):
+# ✅ Hierarchical index: consecutive chunks are grouped into sections whose
+# centroid embedding is searched first; only the best sections' chunks are scanned
+SECTION_SIZE = int(os.getenv("SECTION_SIZE", "32"))       # chunks per section
+SECTION_SEARCH_COUNT = int(os.getenv("SECTION_SEARCH_COUNT", "4"))  # sections searched per query
+
+# ✅ Library search: documents (by centroid) whose chunks are searched per query
+LIBRARY_SEARCH_DOCUMENTS = int(os.getenv("LIBRARY_SEARCH_DOCUMENTS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+def _as_chunk(chunk) -> dict:
+    # ✅ Plain strings (chunk_text) or dicts with page spans (iter_chunks)
+    return chunk if isinstance(chunk, dict) else {"content": chunk}
+
+
+class SectionBuilder:
+    """Groups consecutive chunks into sections with a normalized centroid embedding."""
+
+    def __init__(self, pdf_id: str, user_id: str, size: int = SECTION_SIZE):
+        self.pdf_id = pdf_id
+        self.user_id = user_id
+        self.size = max(1, size)
+        self.section_index = 0
+        self._reset()
+
+    def _reset(self):
+        self.chunk_start = None
+        self.count = 0
+        self.page_start = None
+        self.page_end = None
+        self.total = None
+
+    def add(self, chunk_index: int, chunk: dict, embedding) -> dict | None:
+        """Returns a finished section row when this chunk completes one."""
+        if self.chunk_start is None:
+            self.chunk_start = chunk_index
+            self.page_start = chunk.get("page_start")
+            self.total = [0.0] * len(embedding)
+
+        # ✅ Normalize first so every chunk weighs the same in the centroid
+        norm = math.sqrt(sum(v * v for v in embedding)) or 1.0
+        for i, v in enumerate(embedding):
+            self.total[i] += v / norm
+
+        self.count += 1
+        self.page_end = chunk.get("page_end", self.page_end)
+
+        if self.count >= self.size:
+            return self.finish()
+        return None
+
+    def finish(self) -> dict | None:
+        if not self.count:
+            return None
+
+        norm = math.sqrt(sum(v * v for v in self.total)) or 1.0
+        row = {
+            "pdf_id": self.pdf_id,
+            "user_id": self.user_id,
+            "section_index": self.section_index,
+            "chunk_start": self.chunk_start,
+            "chunk_end": self.chunk_start + self.count,
+            "page_start": self.page_start,
+            "page_end": self.page_end,
+            "embedding": [v / norm for v in self.total]
+        }
+        self.section_index += 1
+        self._reset()
+        return row
+
+
+# -----------------------------
+# Vector store backends
+# -----------------------------
+class VectorStore:
     """
-    Save chunks + embeddings into Supabase table: pdf_chunks
-    Uses batch inserts to avoid payload size limits.
+    Storage + similarity search for chunk embeddings, one index per pdf_id.
+    Rows passed to writers are chunk dicts with content, embedding,
+    chunk_index and page spans.
     """
-    if not chunks:
-        return
 
-    rows = []
-    for chunk in chunks:
-        emb = get_embedding(chunk, api_key=api_key)
+    # ✅ Whether clone_indexed_pdf (upload dedup) can copy this backend's index
+    supports_clone = False
+
+    def writer(self, pdf_id: str, user_id: str):
+        """Returns an object with add(rows) and close(), fed in chunk_index order."""
+        raise NotImplementedError
+
+    def search(self, pdf_id: str, query_embedding, top_k: int) -> list[dict]:
+        """Returns [{text, similarity, chunk_index, page_start, page_end}], best first."""
+        raise NotImplementedError
 
-        rows.append({
-            "pdf_id": pdf_id,
-            "user_id": user_id,
-            "content": chunk,
-            "embedding": emb
-        })
+    def search_library(self, user_id: str, pdf_ids: list[str], query_embedding, top_k: int) -> list[dict]:
+        """
+        Search across a user's PDFs: best documents first, then chunks inside them.
+        Results are like search() plus pdf_id, best first across all documents.
+        """
+        raise NotImplementedError
+
+    def fetch(self, pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+        raise NotImplementedError
+
+    def delete(self, pdf_id: str):
+        raise NotImplementedError
+
+    # ✅ Async variants for async views. The defaults run the sync method in a
+    # worker thread (right for in-process backends); network backends override them.
+    async def asearch(self, pdf_id: str, query_embedding, top_k: int) -> list[dict]:
+        return await asyncio.to_thread(self.search, pdf_id, query_embedding, top_k)
+
+    async def asearch_library(self, user_id: str, pdf_ids: list[str], query_embedding, top_k: int) -> list[dict]:
+        return await asyncio.to_thread(self.search_library, user_id, pdf_ids, query_embedding, top_k)
+
+    async def afetch(self, pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+        return await asyncio.to_thread(self.fetch, pdf_id, chunk_indexes)
+
+
+class _SupabaseWriter:
+    def __init__(self, pdf_id: str, user_id: str):
+        self.pdf_id = pdf_id
+        self.user_id = user_id
+        self.sections = SectionBuilder(pdf_id, user_id)
+        # ✅ One "section" spanning the whole PDF = document centroid (library search, stage 1)
+        self.document = SectionBuilder(pdf_id, user_id, size=math.inf)
+
+    def add(self, rows: list[dict]):
+        for row in rows:
+            self.document.add(row["chunk_index"], row, row["embedding"])
+        section_rows = [self.sections.add(row["chunk_index"], row, row["embedding"]) for row in rows]
+        section_rows = [{**r, "embedding": vector_literal(r["embedding"])} for r in section_rows if r]
+
+        # ✅ Vectors go over the wire as compact pgvector literals, not JSON float lists
+        rows = [
+            {**row, "pdf_id": self.pdf_id, "user_id": self.user_id, "embedding": vector_literal(row["embedding"])}
+            for row in rows
+        ]
 
         # ✅ insert batch
-        if len(rows) >= BATCH_SIZE:
-            supabase.table("pdf_chunks").insert(rows).execute()
-            rows = []
+        for i in range(0, len(rows), BATCH_SIZE):
+            supabase.table("pdf_chunks").insert(rows[i:i + BATCH_SIZE]).execute()
+
+        if section_rows:
+            supabase.table("pdf_sections").insert(section_rows).execute()
+
+    def close(self):
+        last_section = self.sections.finish()
+        if last_section:
+            last_section["embedding"] = vector_literal(last_section["embedding"])
+            supabase.table("pdf_sections").insert(last_section).execute()
+
+        document = self.document.finish()
+        if document:
+            supabase.table("pdf_files").update({
+                "embedding": vector_literal(document["embedding"])
+            }).eq("id", self.pdf_id).execute()
+
+
+class SupabaseVectorStore(VectorStore):
+    """pdf_chunks / pdf_sections tables, searched by match_pdf_chunks_hierarchical."""
+
+    supports_clone = True
+
+    def writer(self, pdf_id: str, user_id: str):
+        return _SupabaseWriter(pdf_id, user_id)
+
+    @staticmethod
+    def _search_params(pdf_id: str, query_embedding, top_k: int) -> dict:
+        # ✅ best sections first, then chunks inside them; flat search for small PDFs
+        return {
+            "query_embedding": vector_literal(query_embedding),
+            "match_pdf_id": pdf_id,
+            "match_count": top_k,
+            "section_count": SECTION_SEARCH_COUNT
+        }
 
-    # ✅ insert remaining
-    if rows:
-        supabase.table("pdf_chunks").insert(rows).execute()
+    @staticmethod
+    def _library_params(user_id: str, query_embedding, top_k: int) -> dict:
+        return {
+            "query_embedding": vector_literal(query_embedding),
+            "match_user_id": user_id,
+            "match_count": top_k,
+            "document_count": LIBRARY_SEARCH_DOCUMENTS
+        }
 
+    @staticmethod
+    def _chunk(row: dict) -> dict:
+        result = {
+            "text": row["content"],
+            "chunk_index": row.get("chunk_index"),
+            "page_start": row.get("page_start"),
+            "page_end": row.get("page_end")
+        }
+        if "similarity" in row:
+            result["similarity"] = row["similarity"]
+        if "pdf_id" in row:
+            result["pdf_id"] = row["pdf_id"]
+        return result
 
-def search_in_vector_db(pdf_id: str, query: str, top_k: int = 6, api_key=None):
+    @staticmethod
+    def _fetch_query(db, pdf_id: str, chunk_indexes: list[int]):
+        return db.table("pdf_chunks") \
+            .select("content, chunk_index, page_start, page_end") \
+            .eq("pdf_id", pdf_id) \
+            .in_("chunk_index", chunk_indexes)
+
+    def search(self, pdf_id: str, query_embedding, top_k: int) -> list[dict]:
+        res = supabase.rpc("match_pdf_chunks_hierarchical", self._search_params(pdf_id, query_embedding, top_k)).execute()
+        return [self._chunk(row) for row in (res.data or [])]
+
+    def search_library(self, user_id: str, pdf_ids: list[str], query_embedding, top_k: int) -> list[dict]:
+        res = supabase.rpc("match_user_chunks", self._library_params(user_id, query_embedding, top_k)).execute()
+        return [self._chunk(row) for row in (res.data or [])]
+
+    def fetch(self, pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+        res = self._fetch_query(supabase, pdf_id, chunk_indexes).execute()
+        return {row["chunk_index"]: self._chunk(row) for row in (res.data or [])}
+
+    async def asearch(self, pdf_id: str, query_embedding, top_k: int) -> list[dict]:
+        db = await get_async_supabase()
+        res = await db.rpc("match_pdf_chunks_hierarchical", self._search_params(pdf_id, query_embedding, top_k)).execute()
+        return [self._chunk(row) for row in (res.data or [])]
+
+    async def asearch_library(self, user_id: str, pdf_ids: list[str], query_embedding, top_k: int) -> list[dict]:
+        db = await get_async_supabase()
+        res = await db.rpc("match_user_chunks", self._library_params(user_id, query_embedding, top_k)).execute()
+        return [self._chunk(row) for row in (res.data or [])]
+
+    async def afetch(self, pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+        db = await get_async_supabase()
+        res = await self._fetch_query(db, pdf_id, chunk_indexes).execute()
+        return {row["chunk_index"]: self._chunk(row) for row in (res.data or [])}
+
+    def delete(self, pdf_id: str):
+        supabase.table("pdf_sections").delete().eq("pdf_id", pdf_id).execute()
+        supabase.table("pdf_chunks").delete().eq("pdf_id", pdf_id).execute()
+
+
+def _local_store():
+    # Imported lazily: NumPy is only needed for this backend
+    from app.services.chat.local_vector_store import LocalVectorStore
+    return LocalVectorStore()
+
+
+_VECTOR_BACKENDS = {
+    "supabase": SupabaseVectorStore,
+    "local": _local_store,
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def register_vector_backend(name: str, factory):
+    """Plug in another backend before first use."""
+    _VECTOR_BACKENDS[name] = factory
+
+
+def get_vector_store() -> VectorStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            factory = _VECTOR_BACKENDS.get(VECTOR_BACKEND)
+            if factory is None:
+                raise ValueError(f"❌ Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+            _store = factory()
+        return _store
+
+
+# -----------------------------
+# Public API (backend independent)
+# -----------------------------
+def add_to_vector_db(pdf_id: str, user_id: str, chunks, api_key=None, on_progress=None):
     """
-    Search using Supabase RPC function: match_pdf_chunks
-    Returns: [{text, similarity}]
+    Save chunks + embeddings into the vector store (Supabase: pdf_chunks).
+    chunks can be any iterable of strings or iter_chunks dicts (with page
+    spans); it is consumed lazily.
+    Embeds chunks in concurrent batched requests (order preserved)
+    and hands each embedded batch to the store right away.
+    on_progress(chunks_stored) is called after each batch, if given.
+    Returns the number of chunks stored.
     """
-    query_emb = get_embedding(query, api_key=api_key)
+    stored = 0
+    chunks = (_as_chunk(c) for c in chunks)
+    writer = get_vector_store().writer(pdf_id, user_id)
+
+    for batch, embeddings in embed_batches_concurrently(chunks, api_key=api_key, get_text=lambda c: c["content"]):
+        rows = [
+            {**chunk, "chunk_index": stored + i, "embedding": emb}
+            for i, (chunk, emb) in enumerate(zip(batch, embeddings))
+        ]
+        writer.add(rows)
+
+        stored += len(rows)
+        if on_progress:
+            on_progress(stored)
+
+    writer.close()
+
+    if stored:
+        logger.info(f"Indexed {stored} chunks for pdf {pdf_id}, embedding cache: {cache_stats()}")
+    return stored
+
+
+def search_in_vector_db(pdf_id: str, query: str, top_k: int = 6, api_key=None, query_embedding=None):
+    """
+    Similarity search in the configured vector store.
+    Pass query_embedding to reuse one already computed this turn.
+    Returns: [{text, similarity, chunk_index, page_start, page_end}]
+    """
+    query_emb = query_embedding or get_query_embedding(query, api_key=api_key)
+    return get_vector_store().search(pdf_id, query_emb, top_k)
+
+
+def fetch_chunks(pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+    """Chunk rows by chunk_index (for hits that came from the keyword index)."""
+    if not chunk_indexes:
+        return {}
+    return get_vector_store().fetch(pdf_id, chunk_indexes)
+
+
+async def asearch_in_vector_db(pdf_id: str, query: str, top_k: int = 6, api_key=None, query_embedding=None):
+    """Async search_in_vector_db."""
+    query_emb = query_embedding or await aget_query_embedding(query, api_key=api_key)
+    return await get_vector_store().asearch(pdf_id, query_emb, top_k)
+
+
+async def asearch_library(user_id: str, pdf_ids: list[str], query: str, top_k: int = 8, api_key=None, query_embedding=None):
+    """
+    Search all of a user's PDFs (pdf_ids = the user's PDFs, used by backends
+    that don't keep user ownership). Returns search_in_vector_db results plus pdf_id.
+    """
+    if not pdf_ids:
+        return []
+    query_emb = query_embedding or await aget_query_embedding(query, api_key=api_key)
+    return await get_vector_store().asearch_library(user_id, pdf_ids, query_emb, top_k)
+
 
-    res = supabase.rpc("match_pdf_chunks", {
-        "query_embedding": query_emb,
-        "match_pdf_id": pdf_id,
-        "match_count": top_k
-    }).execute()
+async def afetch_chunks(pdf_id: str, chunk_indexes: list[int]) -> dict[int, dict]:
+    if not chunk_indexes:
+        return {}
+    return await get_vector_store().afetch(pdf_id, chunk_indexes)
 
-    results = []
-    if res.data:
-        for row in res.data:
-            results.append({
-                "text": row["content"],
-                "similarity": row["similarity"]
-            })
 
-    return results
+def delete_pdf_chunks(pdf_id: str):
+    get_vector_store().delete(pdf_id)
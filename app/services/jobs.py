@@ -0,0 +1,222 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from app.core.extensions import supabase, get_async_supabase
+
+logger = logging.getLogger(__name__)
+
+# ✅ "thread" runs jobs in this process; "inline" runs them inside the request;
+# "supabase" leaves them queued in ingest_jobs for a worker invocation (serverless
+# platforms like Vercel freeze background threads after the response)
+INGEST_QUEUE_BACKEND = os.getenv("INGEST_QUEUE_BACKEND", "supabase" if os.getenv("VERCEL") else "thread")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+
+# ✅ Worker endpoint for the "supabase" queue: kicked after each upload (and by a cron
+# or a stalled job's status poll). Its own invocation, so the upload request returns at once.
+VERCEL_URL = os.getenv("VERCEL_URL")
+INGEST_WORKER_URL = os.getenv("INGEST_WORKER_URL") or (f"https://{VERCEL_URL}/upload/jobs/run" if VERCEL_URL else None)
+INGEST_WORKER_SECRET = os.getenv("INGEST_WORKER_SECRET") or os.getenv("CRON_SECRET")
+# Seconds of jobs per invocation: no new job is claimed after it, so keep it below the
+# function's maxDuration (300 in vercel.json) by about one job's run time
+INGEST_WORKER_BUDGET = float(os.getenv("INGEST_WORKER_BUDGET", "240"))
+
+# ✅ A running job without progress for this long lost its worker (e.g. function timeout)
+# and is picked up again; after INGEST_MAX_ATTEMPTS it is marked failed
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", "300"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_KICK_AFTER = 30  # seconds a job may stay queued before its status poll kicks the worker again
+
+# ✅ Don't write progress to the DB more often than this (seconds)
+PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "1.0"))
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# -----------------------------
+# Queue backends
+# -----------------------------
+class JobQueue:
+    """Minimal queue interface: run `func(*args, **kwargs)` somewhere, eventually."""
+
+    def submit(self, func, *args, **kwargs):
+        raise NotImplementedError
+
+
+class ThreadJobQueue(JobQueue):
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+
+    def submit(self, func, *args, **kwargs):
+        self.pool.submit(func, *args, **kwargs)
+
+
+class InlineJobQueue(JobQueue):
+    def submit(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+
+class SupabaseJobQueue(JobQueue):
+    """
+    The queued ingest_jobs row is the message: a worker invocation claims it
+    (claim_job) and rebuilds the call from its ids. submit only wakes a worker.
+    """
+
+    def submit(self, func, *args, **kwargs):
+        kick_worker()
+
+
+_QUEUE_BACKENDS = {
+    "thread": ThreadJobQueue,
+    "inline": InlineJobQueue,
+    "supabase": SupabaseJobQueue,
+}
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def register_queue_backend(name: str, factory):
+    """Plug in another backend (e.g. RQ / Celery wrapper) before first use."""
+    _QUEUE_BACKENDS[name] = factory
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            factory = _QUEUE_BACKENDS.get(INGEST_QUEUE_BACKEND)
+            if factory is None:
+                raise ValueError(f"❌ Unknown INGEST_QUEUE_BACKEND: {INGEST_QUEUE_BACKEND}")
+            _queue = factory()
+        return _queue
+
+
+# -----------------------------
+# Job store (Supabase table: ingest_jobs)
+# -----------------------------
+def create_job(pdf_id: str, user_id: str) -> dict:
+    res = supabase.table("ingest_jobs").insert({
+        "pdf_id": pdf_id,
+        "user_id": user_id,
+        "status": "queued"
+    }).execute()
+    return res.data[0]
+
+
+def update_job(job_id: str, **fields):
+    fields["updated_at"] = _now()
+    supabase.table("ingest_jobs").update(fields).eq("id", job_id).execute()
+
+
+async def aget_job(job_id: str, user_id: str) -> dict | None:
+    db = await get_async_supabase()
+    res = await db.table("ingest_jobs") \
+        .select("*") \
+        .eq("id", job_id) \
+        .eq("user_id", user_id) \
+        .limit(1) \
+        .execute()
+    return res.data[0] if res.data else None
+
+
+def claim_job() -> dict | None:
+    """Next queued (or stalled) job, marked as taken by this worker; None when there is none."""
+    res = supabase.rpc("claim_ingest_job", {
+        "stale_seconds": INGEST_STALE_SECONDS,
+        "max_attempts": INGEST_MAX_ATTEMPTS
+    }).execute()
+    return res.data[0] if res.data else None
+
+
+def kick_worker():
+    """Starts a worker invocation without waiting for it (it keeps running after we hang up)."""
+    if not INGEST_WORKER_URL:
+        logger.warning("INGEST_WORKER_URL is not set; queued jobs wait for the next cron run")
+        return
+    if not INGEST_WORKER_SECRET:
+        logger.warning("INGEST_WORKER_SECRET (or CRON_SECRET) is not set; the worker endpoint refuses every call")
+        return
+
+    headers = {"Authorization": f"Bearer {INGEST_WORKER_SECRET}"}
+    try:
+        requests.post(INGEST_WORKER_URL, headers=headers, timeout=(5, 1))
+    except requests.exceptions.ReadTimeout:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not start the ingestion worker: {e}")
+
+
+def needs_worker(job: dict) -> bool:
+    """A "supabase" queue job that nobody seems to be working on (lost kick / dead worker)."""
+    if INGEST_QUEUE_BACKEND != "supabase" or job.get("status") in ("done", "failed"):
+        return False
+
+    since = job.get("created_at") if job.get("status") == "queued" else job.get("updated_at")
+    if not since:
+        return False
+    idle = (datetime.now(timezone.utc) - datetime.fromisoformat(since)).total_seconds()
+    return idle > (INGEST_KICK_AFTER if job.get("status") == "queued" else INGEST_STALE_SECONDS)
+
+
+def job_eta_seconds(job: dict) -> float | None:
+    """Linear ETA: page throughput while parsing, then embedding throughput."""
+    started = job.get("started_at")
+    if job.get("status") != "indexing" or not started:
+        return None
+
+    elapsed = (datetime.now(timezone.utc) - datetime.fromisoformat(started)).total_seconds()
+
+    pages_done = job.get("pages_done") or 0
+    pages_total = job.get("pages_total") or 0
+    if pages_done and pages_done < pages_total:
+        return round(max(0.0, elapsed / pages_done * (pages_total - pages_done)), 1)
+
+    done = job.get("chunks_embedded") or 0
+    total = job.get("chunks_total") or 0
+    if done and total:
+        return round(max(0.0, elapsed / done * (total - done)), 1)
+
+    return None
+
+
+class JobProgress:
+    """
+    Collects progress fields and writes them at most every PROGRESS_INTERVAL.
+    Status changes are always written straight away.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.pending = {}
+        self.last_write = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, **fields):
+        with self.lock:
+            self.pending.update(fields)
+            if "status" not in fields and time.monotonic() - self.last_write < PROGRESS_INTERVAL:
+                return
+            self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+        try:
+            update_job(self.job_id, **self.pending)
+        except Exception as e:
+            # ✅ Progress reporting must never kill the ingestion itself
+            logger.warning(f"Job progress update failed for {self.job_id}: {e}")
+        self.pending = {}
+        self.last_write = time.monotonic()
@@ -0,0 +1,107 @@
+import os
+import logging
+
+from app.core.cache import LRUCache
+from app.core.extensions import supabase, get_async_supabase
+
+logger = logging.getLogger(__name__)
+
+# ✅ Per-user lookups (users row, sidebar PDF list) are cached per process and
+# dropped on every write made through this app. The TTL bounds staleness for
+# writes done by another worker or directly in the DB.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+
+USER_FIELDS = "id, email, username, first_name, last_name, phone_no, gemini_api_key"
+
+_users = LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_pdf_lists = LRUCache(USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_MISSING = object()
+
+
+# -----------------------------
+# users
+# -----------------------------
+def _user_query(db, user_id: str):
+    return db.table("users").select(USER_FIELDS).eq("id", user_id).limit(1)
+
+
+def _store_user(user_id: str, rows) -> dict:
+    row = rows[0] if rows else _MISSING
+    _users.set(user_id, row)
+    return row
+
+
+def get_user(user_id: str) -> dict | None:
+    """The user's row (profile fields + API key); one select serves all of them."""
+    row = _users.get(user_id)
+    if row is None:
+        res = _user_query(supabase, user_id).execute()
+        row = _store_user(user_id, res.data)
+
+    return None if row is _MISSING else dict(row)
+
+
+async def aget_user(user_id: str) -> dict | None:
+    row = _users.get(user_id)
+    if row is None:
+        db = await get_async_supabase()
+        res = await _user_query(db, user_id).execute()
+        row = _store_user(user_id, res.data)
+
+    return None if row is _MISSING else dict(row)
+
+
+def get_api_key(user_id: str):
+    user = get_user(user_id)
+    return user.get("gemini_api_key") if user else None
+
+
+async def aget_api_key(user_id: str):
+    user = await aget_user(user_id)
+    return user.get("gemini_api_key") if user else None
+
+
+def is_profile_complete(user_id: str) -> bool:
+    user = get_user(user_id)
+    if not user:
+        return False
+
+    return bool(
+        user.get("username")
+        and user.get("first_name")
+        and user.get("last_name")
+        and user.get("phone_no")
+    )
+
+
+def invalidate_user(user_id: str):
+    _users.pop(user_id)
+
+
+# -----------------------------
+# pdf_files (sidebar)
+# -----------------------------
+async def aget_pdf_list(user_id: str) -> list[dict]:
+    """The user's PDFs, newest first (sidebar + library search)."""
+    pdfs = _pdf_lists.get(user_id)
+    if pdfs is not None:
+        return list(pdfs)
+
+    db = await get_async_supabase()
+    res = await db.table("pdf_files") \
+        .select("id, filename, original_filename, created_at") \
+        .eq("user_id", user_id) \
+        .order("created_at", desc=True) \
+        .execute()
+    pdfs = res.data if res.data else []
+    _pdf_lists.set(user_id, pdfs)
+    return list(pdfs)
+
+
+def invalidate_pdf_list(user_id: str):
+    _pdf_lists.pop(user_id)
+
+
+def cache_stats() -> dict:
+    return {"users": _users.stats(), "pdf_lists": _pdf_lists.stats()}
@@ -0,0 +1,145 @@
+"""
+Chunking benchmark: legacy fixed-width slicing vs structure-aware chunking.
+
+Reports, per strategy:
+  - chunk count / embedding tokens (ingest cost)
+  - hit@1 / hit@3: a sampled sentence is "found" if a top-k chunk contains it
+    whole (retrieval is BM25 over the chunks, so no API key is needed)
+  - context tokens sent to the LLM for top-3
+
+Usage:
+  python benchmarks/chunking_benchmark.py                 # synthetic document
+  python benchmarks/chunking_benchmark.py report.pdf ...  # your own PDFs
+"""
+import os
+import re
+import sys
+import math
+import random
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app package validates Supabase settings on import; the chunkers don't need them
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from app.services.chat.chunking import chunk_pages, estimate_tokens  # noqa: E402
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+SENTENCE_RE = re.compile(r"[^.!?]+[.!?]")
+
+STRATEGIES = [
+    ("fixed (legacy)", {"strategy": "fixed"}),
+    ("structured", {"strategy": "structured"}),
+    ("semantic", {"strategy": "semantic"}),
+]
+
+
+def synthetic_pages(n_pages=60, seed=7):
+    rng = random.Random(seed)
+    topics = [
+        "invoice payment terms net thirty days late fee penalty",
+        "network latency packet loss router firmware upgrade",
+        "clinical trial dosage adverse events placebo cohort",
+        "warehouse inventory forecast shipment pallet supplier",
+        "employee onboarding policy leave benefits payroll",
+    ]
+    filler = "the a of to and in for with on by is are was that this".split()
+    pages = []
+    for page_no in range(1, n_pages + 1):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            vocab = topics[rng.randrange(len(topics))].split()
+            sentences = []
+            for _ in range(rng.randint(3, 7)):
+                words = [rng.choice(vocab if rng.random() < 0.6 else filler) for _ in range(rng.randint(8, 20))]
+                if rng.random() < 0.3:
+                    words.append(f"ID-{rng.randint(1000, 9999)}")
+                sentences.append(" ".join(words).capitalize() + ".")
+            # pypdf-style hard line wraps inside paragraphs
+            text = " ".join(sentences)
+            lines = [text[i:i + 90] for i in range(0, len(text), 90)]
+            paragraphs.append("\n".join(lines))
+        pages.append((page_no, "\n\n".join(paragraphs)))
+    return pages
+
+
+def pdf_pages(path):
+    from app.services.chat.pdf_utils import iter_pdf_pages
+    with open(path, "rb") as f:
+        return list(iter_pdf_pages(f.read(), workers=1))
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+class BM25:
+    def __init__(self, docs, k1=1.2, b=0.75):
+        self.docs = [Counter(WORD_RE.findall(d.lower())) for d in docs]
+        self.lengths = [sum(d.values()) for d in self.docs]
+        self.avg = sum(self.lengths) / max(1, len(self.lengths))
+        df = Counter(t for d in self.docs for t in d)
+        n = len(self.docs)
+        self.idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+        self.k1, self.b = k1, b
+
+    def top(self, query, k):
+        terms = WORD_RE.findall(query.lower())
+        scores = []
+        for i, d in enumerate(self.docs):
+            s = 0.0
+            for t in terms:
+                tf = d.get(t)
+                if tf:
+                    s += self.idf[t] * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avg))
+            scores.append((s, i))
+        scores.sort(reverse=True)
+        return [i for _, i in scores[:k]]
+
+
+def sample_queries(pages, n=200, seed=11):
+    rng = random.Random(seed)
+    text = normalize(" ".join(t for _, t in pages))
+    sentences = [s.strip() for s in SENTENCE_RE.findall(text) if len(s.split()) >= 8]
+    rng.shuffle(sentences)
+    queries = []
+    for s in sentences[:n]:
+        words = s.split()
+        keep = rng.sample(words, max(4, int(len(words) * 0.6)))
+        queries.append((" ".join(keep), s))
+    return queries
+
+
+def run(pages):
+    queries = sample_queries(pages)
+    print(f"{'strategy':<16} {'chunks':>7} {'emb tokens':>11} {'avg tok':>8} {'hit@1':>7} {'hit@3':>7} {'ctx tok@3':>10}")
+
+    for name, options in STRATEGIES:
+        chunks = [c["content"] for c in chunk_pages(iter(pages), total_pages=len(pages), **options)]
+        normalized = [normalize(c) for c in chunks]
+        index = BM25(chunks)
+
+        hit1 = hit3 = ctx = 0
+        for query, sentence in queries:
+            top = index.top(query, 3)
+            hits = [sentence in normalized[i] for i in top]
+            hit1 += hits[0] if hits else 0
+            hit3 += any(hits)
+            ctx += sum(estimate_tokens(chunks[i]) for i in top)
+
+        tokens = sum(estimate_tokens(c) for c in chunks)
+        q = max(1, len(queries))
+        print(f"{name:<16} {len(chunks):>7} {tokens:>11} {tokens / max(1, len(chunks)):>8.0f} "
+              f"{hit1 / q:>7.1%} {hit3 / q:>7.1%} {ctx / q:>10.0f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            print(f"\n== {path}")
+            run(pdf_pages(path))
+    else:
+        print("== synthetic document (60 pages)")
+        run(synthetic_pages())
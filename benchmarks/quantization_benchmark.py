@@ -0,0 +1,174 @@
+"""
+Quantization benchmark: recall budget and sizes of compact embedding formats.
+
+Runs in NumPy (no database): for a synthetic clustered corpus (or real
+embeddings from a .npy file, rows = chunks of ONE document) it reports,
+per format:
+  - bytes per vector (what the index has to keep in memory)
+  - recall@k of the first stage alone, and after rescoring the top
+    k * factor candidates with the full float32 vectors
+and, for inserts, the payload size of one vector as a JSON float list
+vs the compact pgvector literal sent by add_to_vector_db.
+
+Formats mirror what pgvector offers: vector (float32), halfvec (float16,
+what schema_quantized.sql stores), int8 (what the local NumPy backend can
+store) and binary_quantize (1 bit).
+
+--hierarchical runs the search the app actually makes instead
+(match_pdf_chunks_hierarchical: best SECTION_SEARCH_COUNT section centroids,
+then the chunks inside them) with float32, halfvec, and a binary first
+stage over those chunks rescored in halfvec, and reports recall against
+both the exact top k and the float32 path.
+
+Usage:
+  python benchmarks/quantization_benchmark.py
+  python benchmarks/quantization_benchmark.py --chunks 5000 --top-k 8
+  python benchmarks/quantization_benchmark.py --hierarchical
+  python benchmarks/quantization_benchmark.py --embeddings doc_embeddings.npy
+"""
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app package validates Supabase settings on import; the encoder doesn't need them
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from app.services.chat.embedding_cache import vector_literal  # noqa: E402
+
+DIM = 768
+RESCORE_FACTORS = [1, 4, 10, 20]
+SECTION_SIZE = 32
+SECTION_SEARCH_COUNT = 4
+
+
+def normalize(m):
+    return m / np.linalg.norm(m, axis=-1, keepdims=True)
+
+
+def synthetic_document(rng, n_chunks: int, topics: int = 12):
+    centers = rng.standard_normal((topics, DIM))
+    labels = np.sort(rng.integers(0, topics, n_chunks))
+    return normalize(centers[labels] + 0.8 * rng.standard_normal((n_chunks, DIM))).astype(np.float32)
+
+
+def first_stage_scores(fmt: str, corpus, queries):
+    if fmt == "float32":
+        return queries @ corpus.T
+    if fmt == "float16":
+        return (queries.astype(np.float16) @ corpus.astype(np.float16).T).astype(np.float32)
+    if fmt == "int8":
+        return (queries @ np.round(corpus * 127).astype(np.int8).T.astype(np.float32)) / 127
+    if fmt == "binary":
+        # Hamming distance between sign bits, negated so higher = closer
+        return -((queries > 0)[:, None, :] != (corpus > 0)[None, :, :]).sum(axis=-1)
+    raise ValueError(fmt)
+
+
+BYTES_PER_VECTOR = {"float32": DIM * 4, "float16": DIM * 2, "int8": DIM, "binary": DIM // 8}
+
+
+def recall(found, expected) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]))
+
+
+def half(m):
+    return m.astype(np.float16).astype(np.float32)
+
+
+def hierarchical_search(corpus, sections, query, k: int, fmt: str = "float32", rescore_factor: int | None = None):
+    """match_pdf_chunks_hierarchical in NumPy; halfvec stores corpus, centroids and query as float16."""
+    if fmt == "float16":
+        corpus, sections, query = half(corpus), half(sections), half(query)
+
+    if len(sections) > SECTION_SEARCH_COUNT:
+        best = np.argsort(-(sections @ query))[:SECTION_SEARCH_COUNT]
+        candidates = np.concatenate([np.arange(s * SECTION_SIZE, min((s + 1) * SECTION_SIZE, len(corpus))) for s in best])
+    else:
+        candidates = np.arange(len(corpus))
+
+    if rescore_factor:
+        # binary_quantize first stage (Hamming distance), rescored below
+        hamming = ((corpus[candidates] > 0) != (query > 0)).sum(axis=1)
+        candidates = candidates[np.argsort(hamming, kind="stable")[:k * rescore_factor]]
+
+    return candidates[np.argsort(-(corpus[candidates] @ query))[:k]]
+
+
+def hierarchical_report(corpus, queries, expected, k: int):
+    sections = normalize(np.stack([corpus[s:s + SECTION_SIZE].sum(axis=0) for s in range(0, len(corpus), SECTION_SIZE)]))
+    variants = {
+        "float32": {},
+        "halfvec": {"fmt": "float16"},
+        **{f"binary x{f} + halfvec": {"fmt": "float16", "rescore_factor": f} for f in RESCORE_FACTORS[1:]},
+    }
+
+    baseline = [hierarchical_search(corpus, sections, q, k) for q in queries]
+    print(f"{'hierarchical path':<24}{'recall@k':>10}{'vs float32 path':>18}")
+    for name, options in variants.items():
+        found = [hierarchical_search(corpus, sections, q, k, **options) for q in queries]
+        print(f"{name:<24}{recall(found, expected):>10.3f}{recall(found, baseline):>18.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help=".npy matrix of one document's chunk embeddings")
+    parser.add_argument("--chunks", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--hierarchical", action="store_true", help="measure the app's section-first search path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        corpus = normalize(np.load(args.embeddings).astype(np.float32))
+    else:
+        corpus = synthetic_document(rng, args.chunks)
+
+    picks = rng.integers(0, len(corpus), args.queries)
+    queries = normalize(corpus[picks] + 0.5 * rng.standard_normal((args.queries, corpus.shape[1])) / np.sqrt(corpus.shape[1]))
+    queries = queries.astype(np.float32)
+
+    k = args.top_k
+    exact_scores = queries @ corpus.T
+    expected = np.argsort(-exact_scores, axis=1)[:, :k]
+
+    print(f"corpus: {len(corpus)} chunks x {corpus.shape[1]} dims, {args.queries} queries, top_k={k}\n")
+    if args.hierarchical:
+        hierarchical_report(corpus, queries, expected, k)
+        return
+
+    header = f"{'format':<10}{'bytes/vec':>10}{'stage-1':>10}" + "".join(f"{'x' + str(f) + ' rescored':>14}" for f in RESCORE_FACTORS)
+    print(header)
+
+    for fmt in ["float32", "float16", "int8", "binary"]:
+        scores = first_stage_scores(fmt, corpus, queries)
+        order = np.argsort(-scores, axis=1, kind="stable")
+
+        row = f"{fmt:<10}{BYTES_PER_VECTOR[fmt]:>10}{recall(order[:, :k], expected):>10.3f}"
+        for factor in RESCORE_FACTORS:
+            found = []
+            for qi, candidates in enumerate(order[:, :k * factor]):
+                best = candidates[np.argsort(-exact_scores[qi, candidates])[:k]]
+                found.append(best)
+            row += f"{recall(found, expected):>14.3f}"
+        print(row)
+
+    # Insert payload for one vector: JSON float list (old) vs pgvector literal (add_to_vector_db)
+    sample = [float(v) for v in corpus[0].astype(np.float64) + 1e-9]
+    json_bytes = len(json.dumps(sample))
+    literal = vector_literal(sample)
+    restored = np.array(json.loads(literal))
+    cos = float(restored @ np.array(sample) / (np.linalg.norm(restored) * np.linalg.norm(sample)))
+    print(f"\ninsert payload per vector: JSON {json_bytes} B, literal {len(json.dumps(literal))} B "
+          f"({json_bytes / len(json.dumps(literal)):.1f}x smaller, cosine to original {cos:.9f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Vector search benchmark: the retrieval RPCs in Postgres + pgvector.
+
+Loads a synthetic corpus (N users x M PDFs, clustered 768-dim embeddings,
+a fraction of large PDFs) into a local Postgres using schema.sql (plus
+schema_quantized.sql with --quantized, pgvector >= 0.7), then runs the
+same random queries through each strategy and reports, per strategy:
+  - p50 / p99 latency (ms)
+  - recall@k against the exact float32 top-k (computed in NumPy)
+and the on-disk size of the tables that hold embeddings.
+
+Strategies:
+  - "match_pdf_chunks": exact scan of the whole document through the pdf_id btree
+  - "hierarchical": match_pdf_chunks_hierarchical, what the app calls (best
+    sections first for documents with more than 4 sections, else match_pdf_chunks)
+  - "library": match_user_chunks, the app's search across all PDFs of the
+    user (recall against the exact top-k over all of the user's chunks)
+  - "global HNSW + filter" (--global-hnsw): the same per-document query with an
+    HNSW index over every chunk, which the planner walks and post-filters
+
+!!! Point it at a throwaway database: --reset drops and recreates schema public.
+
+Usage:
+  pip install "psycopg[binary]"
+  python benchmarks/vector_search_benchmark.py --dsn postgresql://localhost/bench --reset
+  python benchmarks/vector_search_benchmark.py --reset --users 50 --pdfs 20 --chunks 200 --queries 300
+  python benchmarks/vector_search_benchmark.py --reset --global-hnsw
+  python benchmarks/vector_search_benchmark.py --reset --quantized
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+
+import numpy as np
+
+try:
+    import psycopg
+except ImportError:
+    sys.exit('This benchmark needs psycopg: pip install "psycopg[binary]"')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 768
+SECTION_SIZE = 32
+
+# name -> (query, scope of the ground truth: one document or the user's library)
+STRATEGIES = {
+    "match_pdf_chunks": ("select id from match_pdf_chunks(%(q)s::vector, %(pdf_id)s, %(k)s)", "document"),
+    "hierarchical": ("select id from match_pdf_chunks_hierarchical(%(q)s::vector, %(pdf_id)s, %(k)s, 4)", "document"),
+    "library": ("select id from match_user_chunks(%(q)s::vector, %(user_id)s, %(k)s)", "library"),
+}
+EMBEDDING_TABLES = ["pdf_chunks", "pdf_sections", "pdf_files"]
+
+GLOBAL_HNSW = "create index pdf_chunks_embedding_idx on pdf_chunks using hnsw (embedding vector_cosine_ops)"
+GLOBAL_HNSW_STRATEGY = """
+    select id from pdf_chunks
+    where pdf_id = %(pdf_id)s
+    order by embedding <=> %(q)s::vector
+    limit %(k)s
+"""
+
+
+def vec_literal(v) -> str:
+    return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
+
+
+def normalize(m):
+    return m / np.linalg.norm(m, axis=-1, keepdims=True)
+
+
+def load_schema(conn, quantized: bool = False):
+    sql = open(os.path.join(ROOT, "schema.sql"), encoding="utf-8").read()
+    if quantized:
+        sql += "\n" + open(os.path.join(ROOT, "schema_quantized.sql"), encoding="utf-8").read()
+    with conn.cursor() as cur:
+        cur.execute("drop schema if exists public cascade; create schema public;")
+        try:
+            cur.execute('create extension if not exists "uuid-ossp";')
+        except psycopg.Error:
+            # Local Postgres builds without uuid-ossp: same function on top of gen_random_uuid()
+            conn.rollback()
+            cur.execute("drop schema if exists public cascade; create schema public;")
+            sql = sql.replace(
+                'create extension if not exists "uuid-ossp";',
+                "create or replace function uuid_generate_v4() returns uuid language sql as 'select gen_random_uuid()';"
+            )
+        cur.execute(sql)
+    conn.commit()
+
+
+def document_embeddings(rng, n_chunks: int, topics: int = 8):
+    """Chunks cluster around a few topic directions, like sections of a real document."""
+    centers = rng.standard_normal((topics, DIM))
+    labels = np.sort(rng.integers(0, topics, n_chunks))
+    return normalize(centers[labels] + 0.8 * rng.standard_normal((n_chunks, DIM))).astype(np.float32)
+
+
+def load_corpus(conn, args, rng):
+    """Returns {pdf_id: (user_id, embedding matrix)} (rows in chunk_index order)."""
+    docs = {}
+    with conn.cursor() as cur:
+        for u in range(args.users):
+            user_id = str(uuid.uuid4())
+            cur.execute("insert into users (id, email) values (%s, %s)", (user_id, f"bench{u}@example.com"))
+
+            for _ in range(args.pdfs):
+                large = rng.random() < args.large_fraction
+                n_chunks = args.large_chunks if large else max(1, int(rng.integers(args.chunks // 2, args.chunks * 3 // 2)))
+                emb = document_embeddings(rng, n_chunks)
+
+                cur.execute(
+                    "insert into pdf_files (user_id, filename, original_filename, storage_path, indexed_at, embedding) "
+                    "values (%s, 'bench.pdf', 'bench.pdf', 'bench', now(), %s) returning id",
+                    (user_id, vec_literal(normalize(emb.sum(axis=0))))
+                )
+                pdf_id = cur.fetchone()[0]
+                docs[pdf_id] = (user_id, emb)
+
+                with cur.copy("copy pdf_chunks (pdf_id, user_id, content, embedding, chunk_index) from stdin") as copy:
+                    for i, row in enumerate(emb):
+                        copy.write_row((pdf_id, user_id, f"chunk {i}", vec_literal(row), i))
+
+                with cur.copy("copy pdf_sections (pdf_id, user_id, section_index, chunk_start, chunk_end, embedding) from stdin") as copy:
+                    for s, start in enumerate(range(0, n_chunks, SECTION_SIZE)):
+                        centroid = normalize(emb[start:start + SECTION_SIZE].sum(axis=0))
+                        copy.write_row((pdf_id, user_id, s, start, min(start + SECTION_SIZE, n_chunks), vec_literal(centroid)))
+
+            conn.commit()
+            print(f"\rloaded {u + 1}/{args.users} users", end="", flush=True)
+
+        cur.execute("analyze")
+    conn.commit()
+    print()
+    return docs
+
+
+def chunk_ids(conn) -> dict:
+    """(pdf_id, chunk_index) -> row id, to compare results with the NumPy ground truth."""
+    with conn.cursor() as cur:
+        cur.execute("select pdf_id, chunk_index, id from pdf_chunks")
+        return {(pdf_id, idx): row_id for pdf_id, idx, row_id in cur.fetchall()}
+
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if values else float("nan")
+
+
+def table_sizes(conn) -> dict:
+    with conn.cursor() as cur:
+        return {
+            table: cur.execute("select pg_total_relation_size(%s::regclass)", (table,)).fetchone()[0]
+            for table in EMBEDDING_TABLES
+        }
+
+
+def measure(conn, name: str, sql: str, scope: str, queries, k: int):
+    latencies, recalls = [], []
+    with conn.cursor() as cur:
+        for query in queries:
+            expected = query[scope]
+            start = time.perf_counter()
+            cur.execute(sql, {**query, "k": k})
+            got = {row[0] for row in cur.fetchall()}
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len(got & expected) / len(expected))
+        conn.rollback()
+
+    print(f"{name:<26}{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}{np.mean(recalls):>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL", "postgresql://localhost/postgres"))
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--pdfs", type=int, default=10, help="PDFs per user")
+    parser.add_argument("--chunks", type=int, default=150, help="average chunks per normal PDF")
+    parser.add_argument("--large-fraction", type=float, default=0.05)
+    parser.add_argument("--large-chunks", type=int, default=6000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--reset", action="store_true", help="drop schema public and load a fresh corpus")
+    parser.add_argument("--global-hnsw", action="store_true", help="also measure a global HNSW index + pdf_id filter")
+    parser.add_argument("--quantized", action="store_true", help="apply schema_quantized.sql (halfvec storage)")
+    args = parser.parse_args()
+    if args.quantized and args.global_hnsw:
+        parser.error("--global-hnsw compares against the float32 schema; run it without --quantized")
+
+    rng = np.random.default_rng(args.seed)
+
+    with psycopg.connect(args.dsn) as conn:
+        if args.reset:
+            load_schema(conn, args.quantized)
+            docs = load_corpus(conn, args, rng)
+        else:
+            sys.exit("Run with --reset to (re)load the synthetic corpus into this database.")
+
+        ids = chunk_ids(conn)
+        pdf_ids = list(docs)
+        total = sum(len(emb) for _, emb in docs.values())
+        print(f"corpus: {len(pdf_ids)} PDFs, {total} chunks, top_k={args.top_k}, {args.queries} queries")
+        print("table sizes: " + ", ".join(f"{t} {size / 2**20:.1f} MB" for t, size in table_sizes(conn).items()) + "\n")
+
+        # Same queries for every strategy: a perturbed chunk of a random PDF
+        queries = []
+        for _ in range(args.queries):
+            pdf_id = pdf_ids[rng.integers(len(pdf_ids))]
+            user_id, emb = docs[pdf_id]
+            q = normalize(emb[rng.integers(len(emb))] + 0.5 * rng.standard_normal(DIM) / np.sqrt(DIM))
+
+            exact = np.argsort(-(emb @ q))[:args.top_k]
+            library = [(float(score), ids[(other, int(i))])
+                       for other, (owner, other_emb) in docs.items() if owner == user_id
+                       for i, score in enumerate(other_emb @ q)]
+            library.sort(reverse=True)
+            queries.append({
+                "pdf_id": pdf_id,
+                "user_id": user_id,
+                "q": vec_literal(q),
+                "document": {ids[(pdf_id, int(i))] for i in exact},
+                "library": {row_id for _, row_id in library[:args.top_k]},
+            })
+
+        print(f"{'strategy':<26}{'p50 ms':>10}{'p99 ms':>10}{'recall@k':>10}")
+        for name, (sql, scope) in STRATEGIES.items():
+            measure(conn, name, sql, scope, queries, args.top_k)
+
+        # Last, since the planner would also walk this index for the strategies above
+        if args.global_hnsw:
+            with conn.cursor() as cur:
+                cur.execute(GLOBAL_HNSW)
+                cur.execute("analyze pdf_chunks")
+            conn.commit()
+            measure(conn, "global HNSW + filter", GLOBAL_HNSW_STRATEGY, "document", queries, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+-- For databases created from an earlier schema.sql, which built a global HNSW index on
+-- pdf_chunks.embedding. Searches are scoped to one document and use the (pdf_id, chunk_index)
+-- btree instead, so the graph only costs insert time and memory.
+drop index if exists public.pdf_chunks_embedding_idx;
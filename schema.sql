@@ -23,9 +23,19 @@ create table public.pdf_files (
   filename text not null,          -- Unique storage filename (e.g., "uuid_file.pdf")
   original_filename text not null, -- Original user filename
   storage_path text not null,      -- Supabase Storage path
+  file_hash text,                  -- sha256 of the uploaded bytes (dedup)
+  indexed_at timestamp with time zone, -- set once all chunks are stored
+  embedding vector(768),           -- normalized centroid of the chunk embeddings (library search)
+  summary_short text,              -- map-reduce summaries built at ingest
+  summary_long text,
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
+create index pdf_files_file_hash_idx on public.pdf_files (user_id, file_hash) where indexed_at is not null;
+
+-- A user's library (sidebar list, library search)
+create index pdf_files_user_id_idx on public.pdf_files (user_id, created_at desc);
+
 -- 3. PDF Chunks (Vector Store)
 create table public.pdf_chunks (
   id bigint generated always as identity primary key,
@@ -33,12 +43,66 @@ create table public.pdf_chunks (
   user_id uuid references public.users(id) on delete cascade not null,
   content text not null,                -- The text chunk content
   embedding vector(768),                -- Gemini text-embedding-004 returns 768 dimensions
+  chunk_index int,                      -- Position of the chunk in the document
+  page_start int,                       -- Page provenance (1-based) ...
+  char_start int,                       -- ... and char offset within page_start
+  page_end int,
+  char_end int,                         -- Exclusive char offset within page_end
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- No global vector index: every search is scoped to one document (its best sections, or all
+-- of its chunks when it has only a few sections), so it runs through the btree below. A global
+-- HNSW graph would be walked across every user's chunks and post-filtered to one pdf_id.
+
+-- Per-document filter + chunk ranges (exact scans and section-level search)
+create index pdf_chunks_pdf_id_chunk_index_idx on public.pdf_chunks (pdf_id, chunk_index);
+
+-- 3c. PDF Sections (hierarchical index for large documents)
+-- Each section covers chunks [chunk_start, chunk_end) and stores their normalized centroid embedding
+create table public.pdf_sections (
+  id bigint generated always as identity primary key,
+  pdf_id uuid references public.pdf_files(id) on delete cascade not null,
+  user_id uuid references public.users(id) on delete cascade not null,
+  section_index int not null,
+  chunk_start int not null,
+  chunk_end int not null,
+  page_start int,
+  page_end int,
+  embedding vector(768) not null,
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
--- Index for vector similarity search (IVFFlat or HNSW)
--- Using HNSW for better performance/recall balance
-create index on public.pdf_chunks using hnsw (embedding vector_cosine_ops);
+create index pdf_sections_pdf_id_idx on public.pdf_sections (pdf_id);
+
+-- 3a. Extracted Page Text (written once at ingest; used for re-chunking / citations)
+-- data = base64(zlib(json array of page texts))
+create table public.pdf_pages (
+  pdf_id uuid primary key references public.pdf_files(id) on delete cascade,
+  page_count int not null,
+  encoding text not null default 'zlib+json',
+  data text not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- 3d. Keyword Index (per-PDF BM25 inverted index, compressed; loaded lazily by the app)
+create table public.pdf_keyword_index (
+  pdf_id uuid references public.pdf_files(id) on delete cascade primary key,
+  chunk_count int not null,
+  encoding text not null,         -- e.g. "bm25-v1+zlib+json"
+  data text not null,             -- base64 of the compressed index
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+-- 3b. Embedding Cache (content-addressed, shared across documents and users)
+-- Key: embedding model + sha256 of the normalized chunk text. No raw text is stored.
+create table public.embedding_cache (
+  model text not null,
+  content_hash text not null,
+  embedding vector(768) not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  primary key (model, content_hash)
+);
 
 -- 4. Chat History
 create table public.chat_history (
@@ -47,11 +111,85 @@ create table public.chat_history (
   user_id uuid references public.users(id) on delete cascade not null,
   question text not null,
   answer text not null,
+  question_embedding vector(768), -- used by the semantic answer cache
   created_at timestamp with time zone default timezone('utc'::text, now()) not null
 );
 
--- RPC Function for Similarity Search
--- Usage: supabase.rpc("match_pdf_chunks", { ... })
+-- Keyset pagination of a conversation: newest first, (created_at, id) as the cursor
+create index chat_history_page_idx on public.chat_history (pdf_id, user_id, created_at desc, id desc);
+
+-- Rolling conversation memory: summary of the turns up to (summarized_until, summarized_id)
+create table public.chat_memory (
+  pdf_id uuid references public.pdf_files(id) on delete cascade not null,
+  user_id uuid references public.users(id) on delete cascade not null,
+  summary text not null default '',
+  summarized_until timestamp with time zone,
+  summarized_id uuid,
+  updated_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  primary key (pdf_id, user_id)
+);
+
+-- 5. Ingestion Jobs (background extract -> chunk -> embed -> insert)
+create table public.ingest_jobs (
+  id uuid default uuid_generate_v4() primary key,
+  pdf_id uuid references public.pdf_files(id) on delete cascade not null,
+  user_id uuid references public.users(id) on delete cascade not null,
+  status text not null default 'queued', -- queued | extracting | indexing | summarizing | done | failed
+  pages_done int not null default 0,
+  pages_total int not null default 0,
+  chunks_embedded int not null default 0,
+  chunks_total int not null default 0,
+  error text,
+  attempts int not null default 0,         -- worker runs ("supabase" queue)
+  started_at timestamp with time zone,
+  updated_at timestamp with time zone default timezone('utc'::text, now()) not null,
+  created_at timestamp with time zone default timezone('utc'::text, now()) not null
+);
+
+create index ingest_jobs_pdf_id_idx on public.ingest_jobs (pdf_id);
+create index ingest_jobs_open_idx on public.ingest_jobs (created_at) where status not in ('done', 'failed');
+
+-- RPC for the "supabase" ingestion queue
+-- Claims the oldest queued job, or a running one without progress for stale_seconds
+-- (its worker was killed, e.g. by a function timeout), and bumps its attempts.
+-- skip locked lets concurrent workers claim different jobs.
+-- Stalled jobs out of attempts fail; stalled summaries are left out (the PDF is already indexed).
+create or replace function claim_ingest_job (
+  stale_seconds int DEFAULT 300,
+  max_attempts int DEFAULT 3
+) returns setof ingest_jobs
+language plpgsql
+as $$
+declare
+  stale_before timestamp with time zone := now() - make_interval(secs => stale_seconds);
+begin
+  update ingest_jobs j
+  set status = 'done', updated_at = timezone('utc'::text, now())
+  where j.status = 'summarizing' and j.updated_at < stale_before;
+
+  update ingest_jobs j
+  set status = 'failed', error = 'Ingestion stopped too many times', updated_at = timezone('utc'::text, now())
+  where j.status in ('extracting', 'indexing') and j.updated_at < stale_before and j.attempts >= max_attempts;
+
+  return query
+  update ingest_jobs j
+  set status = 'extracting', attempts = j.attempts + 1, error = null, updated_at = timezone('utc'::text, now())
+  where j.id = (
+    select q.id
+    from ingest_jobs q
+    where q.status = 'queued'
+       or (q.status in ('extracting', 'indexing') and q.updated_at < stale_before)
+    order by q.created_at
+    limit 1
+    for update skip locked
+  )
+  returning j.*;
+end;
+$$;
+
+-- RPC Function for Similarity Search (one document)
+-- Exact scan of the document's chunks through the pdf_id btree (cost grows with the document,
+-- not the whole table). Used for documents with few sections, see match_pdf_chunks_hierarchical.
 create or replace function match_pdf_chunks (
   query_embedding vector(768),
   match_pdf_id uuid,
@@ -59,7 +197,10 @@ create or replace function match_pdf_chunks (
 ) returns table (
   id bigint,
   content text,
-  similarity float
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
 )
 language plpgsql
 as $$
@@ -68,10 +209,197 @@ begin
   select
     pdf_chunks.id,
     pdf_chunks.content,
-    1 - (pdf_chunks.embedding <=> query_embedding) as similarity
+    1 - (pdf_chunks.embedding <=> query_embedding) as similarity,
+    pdf_chunks.chunk_index,
+    pdf_chunks.page_start,
+    pdf_chunks.page_end
   from pdf_chunks
   where pdf_chunks.pdf_id = match_pdf_id
   order by pdf_chunks.embedding <=> query_embedding
   limit match_count;
 end;
 $$;
+
+-- RPC for hierarchical search (large documents)
+-- Picks the section_count sections closest to the query, then ranks only their chunks.
+-- Documents with section_count sections or fewer use the flat match_pdf_chunks search.
+create or replace function match_pdf_chunks_hierarchical (
+  query_embedding vector(768),
+  match_pdf_id uuid,
+  match_count int DEFAULT 5,
+  section_count int DEFAULT 4
+) returns table (
+  id bigint,
+  content text,
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
+)
+language plpgsql
+as $$
+begin
+  if not exists (
+    select 1 from pdf_sections s
+    where s.pdf_id = match_pdf_id
+    offset section_count
+  ) then
+    return query select * from match_pdf_chunks(query_embedding, match_pdf_id, match_count);
+    return;
+  end if;
+
+  return query
+  with top_sections as (
+    select s.chunk_start, s.chunk_end
+    from pdf_sections s
+    where s.pdf_id = match_pdf_id
+    order by s.embedding <=> query_embedding
+    limit section_count
+  )
+  select
+    c.id,
+    c.content,
+    1 - (c.embedding <=> query_embedding) as similarity,
+    c.chunk_index,
+    c.page_start,
+    c.page_end
+  from top_sections t
+  join pdf_chunks c
+    on c.pdf_id = match_pdf_id
+   and c.chunk_index >= t.chunk_start
+   and c.chunk_index < t.chunk_end
+  order by c.embedding <=> query_embedding
+  limit match_count;
+end;
+$$;
+
+-- RPC for byte-identical re-uploads
+-- Finds an already indexed PDF of the same user with the same file_hash, creates a new
+-- pdf_files row on its storage object and copies its chunks server-side (no re-embedding).
+-- Only the user's own uploads are matched, so upload timing says nothing about other users' files.
+-- Returns no rows when nothing matches.
+create or replace function clone_indexed_pdf (
+  p_user_id uuid,
+  p_file_hash text,
+  p_filename text,
+  p_original_filename text
+) returns table (
+  pdf_id uuid,
+  storage_path text
+)
+language plpgsql
+as $$
+declare
+  source record;
+  new_id uuid;
+begin
+  select f.id, f.storage_path, f.embedding, f.summary_short, f.summary_long
+    into source
+  from pdf_files f
+  where f.user_id = p_user_id
+    and f.file_hash = p_file_hash
+    and f.indexed_at is not null
+  order by f.created_at desc
+  limit 1;
+
+  if not found then
+    return;
+  end if;
+
+  insert into pdf_files (user_id, filename, original_filename, storage_path, file_hash, indexed_at, embedding, summary_short, summary_long)
+  values (p_user_id, p_filename, p_original_filename, source.storage_path, p_file_hash, timezone('utc'::text, now()), source.embedding, source.summary_short, source.summary_long)
+  returning id into new_id;
+
+  insert into pdf_chunks (pdf_id, user_id, content, embedding, chunk_index, page_start, char_start, page_end, char_end)
+  select new_id, p_user_id, c.content, c.embedding, c.chunk_index, c.page_start, c.char_start, c.page_end, c.char_end
+  from pdf_chunks c
+  where c.pdf_id = source.id
+  order by c.id;
+
+  insert into pdf_sections (pdf_id, user_id, section_index, chunk_start, chunk_end, page_start, page_end, embedding)
+  select new_id, p_user_id, s.section_index, s.chunk_start, s.chunk_end, s.page_start, s.page_end, s.embedding
+  from pdf_sections s
+  where s.pdf_id = source.id;
+
+  insert into pdf_pages (pdf_id, page_count, encoding, data)
+  select new_id, p.page_count, p.encoding, p.data
+  from pdf_pages p
+  where p.pdf_id = source.id;
+
+  insert into pdf_keyword_index (pdf_id, chunk_count, encoding, data)
+  select new_id, k.chunk_count, k.encoding, k.data
+  from pdf_keyword_index k
+  where k.pdf_id = source.id;
+
+  return query select new_id, source.storage_path;
+end;
+$$;
+
+-- RPC for library-wide search (all PDFs of one user)
+-- Stage 1 ranks the user's indexed documents by centroid (a user has at most a few hundred,
+-- so this is an exact scan via pdf_files_user_id_idx); stage 2 runs the per-document search
+-- on the document_count best ones and merges their chunks by similarity.
+create or replace function match_user_chunks (
+  query_embedding vector(768),
+  match_user_id uuid,
+  match_count int DEFAULT 8,
+  document_count int DEFAULT 5
+) returns table (
+  pdf_id uuid,
+  id bigint,
+  content text,
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
+)
+language sql
+as $$
+  with top_documents as (
+    select f.id
+    from pdf_files f
+    where f.user_id = match_user_id
+      and f.embedding is not null
+    order by f.embedding <=> query_embedding
+    limit document_count
+  )
+  select d.id, m.id, m.content, m.similarity, m.chunk_index, m.page_start, m.page_end
+  from top_documents d
+  cross join lateral match_pdf_chunks_hierarchical(query_embedding, d.id, match_count) m
+  order by m.similarity desc
+  limit match_count;
+$$;
+
+-- RPC for the semantic answer cache: best past answer to a near-identical question.
+-- Only answers newer than the PDF's last (re)index count, so re-chunking invalidates them.
+create or replace function match_cached_answer (
+  match_pdf_id uuid,
+  match_user_id uuid,
+  query_embedding vector(768),
+  min_similarity float default 0.95
+)
+returns table (
+  id uuid,
+  question text,
+  answer text,
+  similarity float
+)
+language sql stable
+as $$
+  select
+    h.id,
+    h.question,
+    h.answer,
+    1 - (h.question_embedding <=> query_embedding) as similarity
+  from chat_history h
+  join pdf_files f on f.id = h.pdf_id
+  where h.pdf_id = match_pdf_id
+    and h.user_id = match_user_id
+    and f.indexed_at is not null
+    and h.created_at > f.indexed_at
+    and h.question_embedding is not null
+    and h.answer not like '❌%'
+    and 1 - (h.question_embedding <=> query_embedding) >= min_similarity
+  order by h.question_embedding <=> query_embedding
+  limit 1;
+$$;
@@ -0,0 +1,150 @@
+-- Optional: compact (halfvec) embedding storage and search.
+-- Requires pgvector >= 0.7 (Supabase ships it). Run after schema.sql; re-running is safe.
+--
+-- Every stored embedding becomes halfvec(768) (2 bytes per dimension instead of 4):
+-- pdf_chunks, pdf_sections (section centroids), pdf_files (document centroids) and
+-- embedding_cache. The search RPCs the app calls (match_pdf_chunks_hierarchical,
+-- match_user_chunks, and match_pdf_chunks under them) are redefined below to score in
+-- halfvec, so each stage reads half the bytes: documents by centroid, then sections by
+-- centroid, then the chunks of the best sections.
+--
+-- Measured with benchmarks/quantization_benchmark.py --hierarchical (same path in NumPy,
+-- 3000-chunk document, top 8, recall against the float32 path):
+--   halfvec 0.998, so no full-precision copy is kept around for rescoring
+--   binary_quantize first stage + halfvec rescoring 0.678 with 4x candidates, 0.939 with 10x
+--   (80 of the 128 chunks in 4 sections, little left to save), so it is not used
+-- benchmarks/vector_search_benchmark.py --quantized runs the RPCs themselves.
+--
+-- EMBED_WIRE_DIGITS=4 is enough for halfvec and shrinks insert payloads further.
+
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['pdf_chunks', 'pdf_sections', 'pdf_files', 'embedding_cache'] loop
+    if (
+      select format_type(a.atttypid, a.atttypmod)
+      from pg_attribute a
+      where a.attrelid = format('public.%I', t)::regclass and a.attname = 'embedding'
+    ) = 'vector(768)' then
+      execute format('alter table public.%I alter column embedding type halfvec(768) using embedding::halfvec(768)', t);
+    end if;
+  end loop;
+end;
+$$;
+
+-- Same contracts as in schema.sql; only the embedding type changes.
+create or replace function match_pdf_chunks (
+  query_embedding vector(768),
+  match_pdf_id uuid,
+  match_count int DEFAULT 5
+) returns table (
+  id bigint,
+  content text,
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
+)
+language plpgsql
+as $$
+declare
+  query_half halfvec(768) := query_embedding::halfvec(768);
+begin
+  return query
+  select
+    pdf_chunks.id,
+    pdf_chunks.content,
+    1 - (pdf_chunks.embedding <=> query_half) as similarity,
+    pdf_chunks.chunk_index,
+    pdf_chunks.page_start,
+    pdf_chunks.page_end
+  from pdf_chunks
+  where pdf_chunks.pdf_id = match_pdf_id
+  order by pdf_chunks.embedding <=> query_half
+  limit match_count;
+end;
+$$;
+
+create or replace function match_pdf_chunks_hierarchical (
+  query_embedding vector(768),
+  match_pdf_id uuid,
+  match_count int DEFAULT 5,
+  section_count int DEFAULT 4
+) returns table (
+  id bigint,
+  content text,
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
+)
+language plpgsql
+as $$
+declare
+  query_half halfvec(768) := query_embedding::halfvec(768);
+begin
+  if not exists (
+    select 1 from pdf_sections s
+    where s.pdf_id = match_pdf_id
+    offset section_count
+  ) then
+    return query select * from match_pdf_chunks(query_embedding, match_pdf_id, match_count);
+    return;
+  end if;
+
+  return query
+  with top_sections as (
+    select s.chunk_start, s.chunk_end
+    from pdf_sections s
+    where s.pdf_id = match_pdf_id
+    order by s.embedding <=> query_half
+    limit section_count
+  )
+  select
+    c.id,
+    c.content,
+    1 - (c.embedding <=> query_half) as similarity,
+    c.chunk_index,
+    c.page_start,
+    c.page_end
+  from top_sections t
+  join pdf_chunks c
+    on c.pdf_id = match_pdf_id
+   and c.chunk_index >= t.chunk_start
+   and c.chunk_index < t.chunk_end
+  order by c.embedding <=> query_half
+  limit match_count;
+end;
+$$;
+
+create or replace function match_user_chunks (
+  query_embedding vector(768),
+  match_user_id uuid,
+  match_count int DEFAULT 8,
+  document_count int DEFAULT 5
+) returns table (
+  pdf_id uuid,
+  id bigint,
+  content text,
+  similarity float,
+  chunk_index int,
+  page_start int,
+  page_end int
+)
+language sql
+as $$
+  with top_documents as (
+    select f.id
+    from pdf_files f
+    where f.user_id = match_user_id
+      and f.embedding is not null
+    order by f.embedding <=> query_embedding::halfvec(768)
+    limit document_count
+  )
+  select d.id, m.id, m.content, m.similarity, m.chunk_index, m.page_start, m.page_end
+  from top_documents d
+  cross join lateral match_pdf_chunks_hierarchical(query_embedding, d.id, match_count) m
+  order by m.similarity desc
+  limit match_count;
+$$;
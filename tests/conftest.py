@@ -0,0 +1,5 @@
+import os
+
+# app/__init__ builds the Supabase client at import time; no request is ever sent
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("SUPABASE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.test")
@@ -0,0 +1,22 @@
+from app.services.chat.answer_cache import _answer
+
+
+def _row(question, answer="cached"):
+    return [{"id": "h1", "question": question, "answer": answer, "similarity": 0.97}]
+
+
+def test_same_question_is_served_from_cache():
+    assert _answer("p1", "What is on page 3?", _row("what is on page 3")) == "cached"
+
+
+def test_different_numbers_are_not_served_from_cache():
+    assert _answer("p1", "What is on page 4?", _row("What is on page 3?")) is None
+    assert _answer("p1", "Revenue in 2023?", _row("Revenue in 2022?")) is None
+
+
+def test_different_identifiers_are_not_served_from_cache():
+    assert _answer("p1", "What does error E-102 mean?", _row("What does error E-101 mean?")) is None
+
+
+def test_no_rows_is_a_miss():
+    assert _answer("p1", "What is on page 3?", []) is None
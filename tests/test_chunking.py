@@ -0,0 +1,42 @@
+from app.services.chat.chunking import iter_structured_chunks
+
+NUMERIC_TEXT = (
+    "The ratio 4.5 in section 3.2 was measured twice. Pi is roughly 3.14159 in every run. "
+    "Release v2.3.1 replaced v2.3.0 after the audit. Details live at www.example.com and "
+    "https://docs.example.com/v1.2/guide.html for reference. Costs rose 12.75% to $1,204.50 "
+    "in Q3. The error code ERR-4021 appears in build 10.0.19045.3803 only, e.g. on the old parser. "
+) * 6
+
+
+def _words(text):
+    return set(text.split())
+
+
+def test_decimals_versions_and_urls_are_never_split():
+    chunks = list(iter_structured_chunks([(1, NUMERIC_TEXT)], max_tokens=50))
+
+    assert len(chunks) > 1
+    source_words = _words(NUMERIC_TEXT)
+    for chunk in chunks:
+        # every word of every chunk is a whole word of the source text
+        assert _words(chunk["content"]) <= source_words, chunk["content"]
+
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = list(iter_structured_chunks([(1, NUMERIC_TEXT)], max_tokens=50))
+
+    for chunk in chunks[:-1]:
+        assert chunk["content"].rstrip().endswith((".", "!", "?")), chunk["content"]
+
+
+def test_overlap_stays_within_max_tokens():
+    # long sentences: two carried ones plus the next would be ~3x the budget
+    sentence = "The quarterly report lists every regional office and its staff count in detail. "
+    text = "".join(sentence * 3 + "\n\n" for _ in range(12))
+    chunks = list(iter_structured_chunks([(1, text)], max_tokens=60, overlap_sentences=2))
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk["content"]) <= 60 * 4, chunk["content"]
+    # consecutive chunks still share text
+    assert any(a["content"][-40:] in b["content"] for a, b in zip(chunks, chunks[1:]))
@@ -0,0 +1,36 @@
+import pytest
+
+from app.services.chat.conversation_memory import looks_like_followup
+
+
+@pytest.mark.parametrize("question", [
+    "What about the second quarter?",
+    "and the risks?",
+    "How about in 2023",
+    "What does that mean?",
+    "Explain this.",
+    "Does this apply to contractors?",
+    "Who wrote it?",
+    "What are their main findings",
+    "Tell me more about the second point",
+    "Expand on point 3",
+    "Which is cheaper, the former or the latter?",
+    "Can you explain what you mentioned about fees?",
+    "iska matlab kya hai?",
+])
+def test_followups_are_detected(question):
+    assert looks_like_followup(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Revenue in 2023?",
+    "Summarize chapter 4",
+    "What does this document say about refunds?",
+    "What is the first chapter about?",
+    "Who is the author of the report?",
+    "List the key risks in section 2",
+    "How does the model handle missing data",
+    "Use cases for the API",
+])
+def test_standalone_questions_are_not_followups(question):
+    assert not looks_like_followup(question)